@@ -0,0 +1,12 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def test_environment():
+    """Как core.runner.TestRunner: временный файл кэша и строгие
+    бюджеты запросов."""
+    from django.test.utils import override_settings
+
+    from core.cache import isolated_caches
+    with isolated_caches(), override_settings(QUERY_BUDGET_STRICT=True):
+        yield
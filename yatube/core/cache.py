@@ -0,0 +1,287 @@
+"""Кэш Django в файле SQLite, общий для всех процессов на сервере.
+
+LocMemCache у каждого воркера свой: страница считается в каждом
+процессе заново, а сброс кэша из одного процесса не виден другим.
+Здесь записи лежат в одном файле в режиме WAL: читатели не ждут
+писателя, каждая операция атомарна. Целые числа хранятся как INTEGER,
+поэтому incr - это UPDATE без гонки "прочитать-записать" и чтение
+результата в той же транзакции. Число записей и их объем ведут
+триггеры; при превышении MAX_ENTRIES или MAX_SIZE (байт) удаляются
+сначала истекшие записи, затем 1/CULL_FREQUENCY записей, истекающих
+раньше остальных, как в DatabaseCache.
+"""
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+from django.test.utils import override_settings
+
+from core.db.sqlite.base import LOCK_BACKOFF, LOCK_RETRIES
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    'key TEXT PRIMARY KEY, value BLOB, expires REAL, size INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    'CREATE TABLE IF NOT EXISTS cache_stats ('
+    'id INTEGER PRIMARY KEY CHECK (id = 1), '
+    'entries INTEGER NOT NULL, size INTEGER NOT NULL)',
+    'INSERT OR IGNORE INTO cache_stats VALUES (1, 0, 0)',
+    'CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN '
+    'UPDATE cache_stats SET entries = entries + 1, size = size + new.size; '
+    'END',
+    'CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN '
+    'UPDATE cache_stats SET entries = entries - 1, size = size - old.size; '
+    'END',
+    'CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache '
+    'BEGIN UPDATE cache_stats SET size = size - old.size + new.size; END',
+)
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+)
+# ON CONFLICT ... DO UPDATE есть с SQLite 3.24
+MIN_SQLITE_VERSION = (3, 24, 0)
+ALIVE = '(expires IS NULL OR expires > ?)'
+UPSERT = (
+    'INSERT INTO cache (key, value, expires, size) '
+    'VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+    'value = excluded.value, expires = excluded.expires, '
+    'size = excluded.size'
+)
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            raise ImproperlyConfigured(
+                'SQLiteCache требует SQLite %s или новее, установлен %s' % (
+                    '.'.join(map(str, MIN_SQLITE_VERSION)),
+                    sqlite3.sqlite_version))
+        super().__init__(params)
+        self.location = location
+        options = params.get('OPTIONS', {})
+        self.max_size = int(options.get('MAX_SIZE', 0)) or None
+        self._local = threading.local()
+
+    def _connection(self):
+        # Соединение на поток, и новое после fork: sqlite3 нельзя
+        # передавать между процессами
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.location))
+            os.makedirs(directory, exist_ok=True)
+            local.connection = self._open()
+            local.pid = os.getpid()
+        return local.connection
+
+    def _open(self):
+        # Процессы, стартующие одновременно, переводят файл в WAL и
+        # создают схему наперегонки: схема - под BEGIN IMMEDIATE, а
+        # сбой открытия повторяется с паузой, как в core.db.sqlite
+        delay = LOCK_BACKOFF
+        for attempt in range(LOCK_RETRIES):
+            connection = sqlite3.connect(
+                self.location, timeout=5, isolation_level=None,
+                check_same_thread=False)
+            try:
+                for pragma in PRAGMAS:
+                    connection.execute(pragma)
+                connection.execute('BEGIN IMMEDIATE')
+                for statement in SCHEMA:
+                    connection.execute(statement)
+                connection.execute('COMMIT')
+                return connection
+            except sqlite3.OperationalError:
+                connection.close()
+                if attempt == LOCK_RETRIES - 1:
+                    raise
+            time.sleep(delay)
+            delay *= 2
+
+    @staticmethod
+    def _dump(value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    @staticmethod
+    def _size(key, value):
+        return len(key) + (len(value) if isinstance(value, bytes) else 8)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        row = self._connection().execute(
+            f'SELECT value FROM cache WHERE key = ? AND {ALIVE}',
+            (key, time.time())).fetchone()
+        if row is None:
+            return default
+        return self._load(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._connection().execute(
+            f'SELECT key, value FROM cache '
+            f'WHERE key IN ({placeholders}) AND {ALIVE}',
+            (*keys, time.time()))
+        return {keys[key]: self._load(value) for key, value in rows}
+
+    def _row(self, key, value, timeout):
+        value = self._dump(value)
+        return (key, value, self.get_backend_timeout(timeout),
+                self._size(key, value))
+
+    def _write(self, sql, key, value, timeout, *params):
+        changed = self._connection().execute(
+            sql, (*self._row(key, value, timeout), *params)).rowcount
+        self._cull()
+        return changed > 0
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write(UPSERT, self._key(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        # Одна транзакция и одна проверка лимитов на всю пачку
+        rows = [self._row(self._key(key, version), value, timeout)
+                for key, value in data.items()]
+        if rows:
+            connection = self._connection()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany(UPSERT, rows)
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+            self._cull()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Вставка или замена только истекшей записи - одним запросом
+        return self._write(
+            UPSERT + ' WHERE cache.expires IS NOT NULL '
+            'AND cache.expires <= ?',
+            self._key(key, version), value, timeout, time.time())
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        # RETURNING есть только с SQLite 3.35: UPDATE и чтение нового
+        # значения под одной блокировкой записи
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            updated = connection.execute(
+                f'UPDATE cache SET value = value + ? WHERE key = ? '
+                f"AND typeof(value) = 'integer' AND {ALIVE}",
+                (delta, key, time.time())).rowcount
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        if not updated:
+            raise ValueError("Key '%s' not found" % key)
+        return row[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        return self._connection().execute(
+            f'UPDATE cache SET expires = ? WHERE key = ? AND {ALIVE}',
+            (self.get_backend_timeout(timeout), key, time.time())).rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._connection().execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {ALIVE}',
+            (key, time.time())).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self._connection().execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),))
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            placeholders = ', '.join('?' * len(keys))
+            self._connection().execute(
+                f'DELETE FROM cache WHERE key IN ({placeholders})', keys)
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def stats(self):
+        entries, size = self._connection().execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+        return {'entries': entries, 'size': size}
+
+    def _over_limit(self, connection):
+        entries, size = connection.execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+        return entries > self._max_entries or (
+            self.max_size is not None and size > self.max_size)
+
+    def _cull(self):
+        connection = self._connection()
+        if not self._over_limit(connection):
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        if not self._over_limit(connection):
+            return
+        if self._cull_frequency == 0:
+            self.clear()
+            return
+        # Удаляем раньше всех истекающие, бессрочные (NULL) - последними
+        connection.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+            'ORDER BY expires IS NULL, expires LIMIT '
+            '(SELECT entries FROM cache_stats) / ? + 1)',
+            (self._cull_frequency,))
+
+    def close(self, **kwargs):
+        # Соединение держим открытым между запросами, как CONN_MAX_AGE
+        pass
+
+
+@contextmanager
+def isolated_caches():
+    """Переносит кэши SQLiteCache во временный каталог.
+
+    Тесты и bench чистят кэш и кладут в него страницы своей базы;
+    в рабочем файле это портило бы кэш сайта.
+    """
+    directory = tempfile.mkdtemp(prefix='yatube-cache-')
+    caches = {}
+    for alias, params in settings.CACHES.items():
+        params = dict(params)
+        if params['BACKEND'] == f'{__name__}.SQLiteCache':
+            params['LOCATION'] = os.path.join(directory, f'{alias}.sqlite3')
+        caches[alias] = params
+    try:
+        with override_settings(CACHES=caches):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
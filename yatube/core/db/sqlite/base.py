@@ -0,0 +1,66 @@
+"""SQLite с настройками для сайта под параллельной нагрузкой.
+
+При подключении включаются WAL (читатели не ждут писателя),
+synchronous=NORMAL, mmap и кэш страниц побольше, busy_timeout.
+Транзакции начинаются с BEGIN IMMEDIATE: блокировка записи берется
+сразу, а не при первой записи, иначе две транзакции, которые
+прочитали и пытаются писать, упираются друг в друга без ожидания.
+Запрос вне транзакции, получивший "database is locked", повторяется
+с нарастающей паузой. Прагмы можно переопределить ключом PRAGMAS
+в настройках базы.
+"""
+import time
+
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение - в килобайтах
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+LOCK_RETRIES = 5
+LOCK_BACKOFF = 0.05
+
+
+def is_locked(error):
+    return 'database is locked' in str(error)
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    def _retry(self, method, *args):
+        delay = LOCK_BACKOFF
+        for attempt in range(LOCK_RETRIES):
+            try:
+                return method(*args)
+            except base.Database.OperationalError as error:
+                # Внутри транзакции повтор одного запроса не поможет
+                if (not is_locked(error) or self.connection.in_transaction
+                        or attempt == LOCK_RETRIES - 1):
+                    raise
+            time.sleep(delay)
+            delay *= 2
+
+    def execute(self, query, params=None):
+        return self._retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        return self._retry(super().executemany, query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        pragmas = self.settings_dict.get('PRAGMAS', PRAGMAS)
+        for name, value in pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def create_cursor(self, name=None):
+        return self.connection.cursor(factory=SQLiteCursorWrapper)
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
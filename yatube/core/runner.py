@@ -0,0 +1,22 @@
+from contextlib import ExitStack
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from core.cache import isolated_caches
+
+
+class TestRunner(DiscoverRunner):
+    """Запускает тесты с кэшем во временном файле, а не в рабочем, и
+    со строгими бюджетами запросов (posts.querycount)."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._environment = ExitStack()
+        self._environment.enter_context(isolated_caches())
+        self._environment.enter_context(
+            override_settings(QUERY_BUDGET_STRICT=True))
+
+    def teardown_test_environment(self, **kwargs):
+        self._environment.close()
+        super().teardown_test_environment(**kwargs)
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search
 from .models import Group, Post
 
 
@@ -13,6 +14,16 @@ class PostAdmin(admin.ModelAdmin):
     list_editable = ('group', 'text')
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тексту идет через FTS5-индекс, а не LIKE по таблице
+        if not search_term or not search.is_supported():
+            return super().get_search_results(
+                request, queryset, search_term)
+        # Без слов MATCH '' - синтаксическая ошибка FTS5
+        if not search.match_expression(search_term):
+            return queryset.none(), False
+        return queryset.filter(pk__in=search.matching_ids(search_term)), False
+
 # При регистрации модели Post источником конфигурации для неё назначаем
 # класс PostAdmin
 
@@ -0,0 +1,395 @@
+"""Нагрузочный прогон маршрутов posts через WSGI-приложение.
+
+Запросы собираются в WSGI environ и отдаются yatube.wsgi.application
+из пула потоков, как это делает многопоточный сервер, только без сети.
+На каждый запрос замеряются время и число SQL-запросов; по маршруту
+считаются p50/p95/p99, пропускная способность и запросы на ответ.
+"""
+import io
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY)
+from django.db import OperationalError, connection, connections, transaction
+from django.template.loader import get_template
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+from django.utils.module_loading import import_string
+
+from .models import Group, Post, User
+from .pagination import WindowedPaginator
+from .seeding import zipf_cum_weights
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга по отсортированному списку."""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+
+def login_cookie(user):
+    """Cookie сессии залогиненного пользователя, как после входа."""
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+
+class Sample:
+    """Случайные объекты для адресов маршрутов, выбираются один раз."""
+
+    def __init__(self, size=1000):
+        self.usernames = list(User.objects.filter(
+            posts__isnull=False).distinct().values_list(
+            'username', flat=True)[:size])
+        self.slugs = list(Group.objects.values_list('slug', flat=True))
+        self.post_ids = list(Post.objects.order_by('?').values_list(
+            'pk', flat=True)[:size])
+        self.words = [
+            word for text in Post.objects.filter(
+                pk__in=self.post_ids[:50]).values_list('text', flat=True)
+            for word in text.split() if len(word) > 3
+        ] or ['пост']
+        readers = User.objects.filter(following__isnull=False).distinct()
+        self.reader = readers.first() or User.objects.first()
+
+
+ROUTES = {
+    'index': lambda sample: ('GET', reverse('posts:index'), {
+        'page': random.randint(1, 5)}),
+    'group_list': lambda sample: ('GET', reverse(
+        'posts:group_list', args=[random.choice(sample.slugs)]), {}),
+    'profile': lambda sample: ('GET', reverse(
+        'posts:profile', args=[random.choice(sample.usernames)]), {}),
+    'post_detail': lambda sample: ('GET', reverse(
+        'posts:post_detail', args=[random.choice(sample.post_ids)]), {}),
+    'follow_index': lambda sample: ('GET', reverse('posts:follow_index'), {}),
+    'search': lambda sample: ('GET', reverse('posts:search'), {
+        'q': random.choice(sample.words)}),
+    'add_comment': lambda sample: ('POST', reverse(
+        'posts:add_comment', args=[random.choice(sample.post_ids)]), {
+        'text': 'Комментарий из нагрузочного теста'}),
+    'post_create': lambda sample: ('POST', reverse('posts:post_create'), {
+        'text': 'Пост из нагрузочного теста'}),
+}
+
+
+class Client:
+    """Вызывает WSGI-приложение напрямую и считает SQL-запросы."""
+
+    def __init__(self, application, cookie):
+        self.application = application
+        self.csrf_token = get_random_string(64)
+        self.cookie = (
+            f'{cookie}; {settings.CSRF_COOKIE_NAME}={self.csrf_token}')
+
+    def environ(self, method, path, data):
+        body = b''
+        query = ''
+        if method == 'POST':
+            data = dict(data, csrfmiddlewaretoken=self.csrf_token)
+            body = urlencode(data).encode()
+        else:
+            query = urlencode(data)
+        return {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'HTTP_HOST': 'testserver',
+            'HTTP_COOKIE': self.cookie,
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': io.StringIO(),
+            'wsgi.url_scheme': 'http',
+            'wsgi.version': (1, 0),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+
+    def request(self, method, path, data):
+        """(статус, секунды, число запросов к базе) одного запроса."""
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        status = []
+
+        def start_response(status_line, headers, exc_info=None):
+            status.append(int(status_line.split()[0]))
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            response = self.application(
+                self.environ(method, path, data), start_response)
+            try:
+                for chunk in response:
+                    pass
+            finally:
+                if hasattr(response, 'close'):
+                    response.close()
+        return status[0], time.perf_counter() - started, len(queries)
+
+
+def run_route(client, route, sample, requests, concurrency):
+    """Гоняет маршрут и возвращает сводку по нему."""
+    build = ROUTES[route]
+    plans = [build(sample) for number in range(requests)]
+    started = time.perf_counter()
+    if concurrency == 1:
+        results = [client.request(*plan) for plan in plans]
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(lambda plan: client.request(*plan),
+                                    plans))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(seconds for status, seconds, queries in results)
+    return {
+        'requests': requests,
+        'errors': sum(1 for status, seconds, queries in results
+                      if status >= 400),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'throughput_rps': requests / elapsed,
+        'queries_per_request': sum(
+            queries for status, seconds, queries in results) / requests,
+    }
+
+
+def compare(previous, current):
+    """Отношение метрик нового прогона к прежнему по маршрутам."""
+    ratios = {}
+    for route, result in current['routes'].items():
+        old = previous.get('routes', {}).get(route)
+        if not old:
+            continue
+        ratios[route] = {
+            metric: result[metric] / old[metric]
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps',
+                           'queries_per_request')
+            if old.get(metric)
+        }
+    return ratios
+
+
+def render_paginator(pages, repeats=100):
+    """Время и размер разметки includes/paginator.html на середине ленты.
+
+    Вместо постов - range нужной длины: шаблону пагинатора важно
+    только число страниц.
+    """
+    paginator = WindowedPaginator(
+        range(pages * settings.POSTS_PER_PAGE), settings.POSTS_PER_PAGE)
+    page = paginator.get_page(pages // 2 + 1)
+    template = get_template('includes/paginator.html')
+    started = time.perf_counter()
+    for number in range(repeats):
+        html = template.render({'page_obj': page})
+    return {
+        'pages': pages,
+        'render_ms': (time.perf_counter() - started) / repeats * 1000,
+        'bytes': len(html.encode()),
+    }
+
+
+# Как подключается сайт: стандартный sqlite3 с новым соединением на
+# каждый запрос и core.db.sqlite с постоянными соединениями
+SQLITE_CONFIGS = {
+    'stock': {'ENGINE': 'django.db.backends.sqlite3', 'CONN_MAX_AGE': 0},
+    'tuned': {'ENGINE': 'core.db.sqlite', 'CONN_MAX_AGE': 60},
+}
+SQLITE_SCHEMA = (
+    'CREATE TABLE bench_post (id INTEGER PRIMARY KEY, text TEXT, '
+    'comments_count INTEGER NOT NULL DEFAULT 0)',
+    'CREATE TABLE bench_comment (id INTEGER PRIMARY KEY, '
+    'post_id INTEGER NOT NULL, text TEXT, created REAL)',
+    'CREATE INDEX bench_comment_post ON bench_comment (post_id, id)',
+)
+
+
+def _sqlite_alias(name, path):
+    alias = f'bench_{name}'
+    connections.databases[alias] = dict(SQLITE_CONFIGS[name], NAME=path)
+    connections.ensure_defaults(alias)
+    connections.prepare_test_settings(alias)
+    return alias
+
+
+def _sqlite_prepare(name, path, posts):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    alias = _sqlite_alias(name, path)
+    with connections[alias].cursor() as cursor:
+        for statement in SQLITE_SCHEMA:
+            cursor.execute(statement)
+        cursor.executemany(
+            'INSERT INTO bench_post (id, text) VALUES (%s, %s)',
+            [(number, 'Пост ' * 50) for number in range(posts)])
+    connections[alias].close()
+    return alias
+
+
+def _sqlite_read(alias, posts):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            'SELECT id, text, comments_count FROM bench_post '
+            'ORDER BY id DESC LIMIT 10 OFFSET %s',
+            [random.randrange(posts - 10)])
+        cursor.fetchall()
+        cursor.execute(
+            'SELECT id, text FROM bench_comment WHERE post_id = %s '
+            'ORDER BY id DESC LIMIT 20', [random.randrange(posts)])
+        cursor.fetchall()
+
+
+def _sqlite_write(alias, posts):
+    # Как add_comment: комментарий и счетчик поста в одной транзакции
+    post_id = random.randrange(posts)
+    with transaction.atomic(using=alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO bench_comment (post_id, text, created) '
+                'VALUES (%s, %s, %s)',
+                [post_id, 'Комментарий из нагрузочного теста', time.time()])
+            cursor.execute(
+                'UPDATE bench_post SET comments_count = comments_count + 1 '
+                'WHERE id = %s', [post_id])
+
+
+def sqlite_workload(name, path, readers=8, writers=4, seconds=5.0,
+                    posts=1000):
+    """Читатели и писатели параллельно в одном файле SQLite.
+
+    Каждая операция - как отдельный HTTP-запрос: после нее соединение
+    закрывается, если CONN_MAX_AGE этого не разрешает.
+    """
+    alias = _sqlite_prepare(name, path, posts)
+    stats = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(kind, operation):
+        latencies = []
+        failed = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                operation(alias, posts)
+            except OperationalError:
+                failed += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+            connections[alias].close_if_unusable_or_obsolete()
+        connections[alias].close()
+        del connections[alias]
+        with lock:
+            stats[kind].extend(latencies)
+            errors[kind] += failed
+
+    threads = [
+        threading.Thread(target=worker, args=('read', _sqlite_read))
+        for number in range(readers)
+    ] + [
+        threading.Thread(target=worker, args=('write', _sqlite_write))
+        for number in range(writers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    del connections[alias]
+    del connections.databases[alias]
+    result = {'config': name}
+    for kind, latencies in stats.items():
+        latencies.sort()
+        result[kind] = {
+            'ops_per_second': len(latencies) / seconds,
+            'p95_ms': (percentile(latencies, 95) or 0) * 1000,
+            'errors': errors[kind],
+        }
+    return result
+
+
+# Бэкенды кэша для сравнения; {dir} - временный каталог прогона
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'bench'),
+    'filebased': ('django.core.cache.backends.filebased.FileBasedCache',
+                  '{dir}/filebased'),
+    'sqlite': ('core.cache.SQLiteCache', '{dir}/cache.sqlite3'),
+}
+
+
+def _cache(backend, location, keys):
+    return import_string(backend)(
+        location, {'TIMEOUT': 300, 'OPTIONS': {'MAX_ENTRIES': keys * 2}})
+
+
+def _cache_worker(backend, location, operations, keys, seed):
+    """Воркер как у gunicorn: страница из кэша, при промахе - в кэш."""
+    cache = _cache(backend, location, keys)
+    rng = random.Random(seed)
+    ranks = rng.choices(
+        range(keys), cum_weights=zipf_cum_weights(keys, 1.1), k=operations)
+    page = 'x' * 20000
+    hits = increments = 0
+    started = time.perf_counter()
+    for number, rank in enumerate(ranks):
+        key = f'page:{rank}'
+        if cache.get(key) is None:
+            cache.set(key, page)
+        else:
+            hits += 1
+        # Общий счетчик, как поколения posts.cache
+        if number % 10 == 0:
+            if not cache.add('counter', 1):
+                cache.incr('counter')
+            increments += 1
+    return hits, increments, time.perf_counter() - started
+
+
+def cache_workload(name, directory, processes=4, operations=5000,
+                   keys=500):
+    """Параллельные процессы над одним кэшем.
+
+    hit_rate показывает, видят ли процессы записи друг друга, а
+    counter против increments - теряет ли incr обновления в гонке.
+    """
+    backend, location = CACHE_BACKENDS[name]
+    location = location.format(dir=directory)
+    _cache(backend, location, keys).clear()
+    context = multiprocessing.get_context('fork')
+    started = time.perf_counter()
+    with context.Pool(processes) as pool:
+        results = pool.starmap(_cache_worker, [
+            (backend, location, operations, keys, seed)
+            for seed in range(processes)
+        ])
+    elapsed = time.perf_counter() - started
+    total = processes * operations
+    return {
+        'backend': name,
+        'ops_per_second': total / elapsed,
+        'hit_rate': sum(hits for hits, *rest in results) / total,
+        'increments': sum(increments for hits, increments, *rest in results),
+        'counter': _cache(backend, location, keys).get('counter') or 0,
+    }
@@ -0,0 +1,93 @@
+"""Горячий кэш страницы поста.
+
+post_detail открывают по ссылкам чаще других страниц. Пост с автором,
+его счетчиками и группой и первая порция комментариев лежат в кэше
+одним объектом по id поста, база читается только при промахе.
+Сигналы удаляют объект при правке и удалении поста и при новом или
+удаленном комментарии. Имя и число постов автора и название группы
+сверяются по поколениям, как у карточек (posts.cards).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from . import cards, counters
+from .cache import get_versions
+from .models import Comment, Post
+from .stats import Stats
+
+BUNDLE_KEY = 'post_bundle:{}'
+AUTHOR_POSTS_SCOPE = 'author_posts:{}'
+
+stats = Stats('post_bundles', ('hits', 'misses'))
+
+
+def bundle_stats():
+    """Попадания и промахи кэша постов в этом процессе."""
+    return stats.local()
+
+
+def reset_bundle_stats():
+    stats.reset()
+
+
+def comments_for(post_id):
+    return Comment.objects.filter(post_id=post_id).select_related(
+        'author').only('post', 'text', 'created', 'author__username')
+
+
+def _scopes(author_id, group_id):
+    scopes = [cards.AUTHOR_SCOPE.format(author_id),
+              AUTHOR_POSTS_SCOPE.format(author_id)]
+    if group_id is not None:
+        scopes.append(cards.GROUP_SCOPE.format(group_id))
+    return scopes
+
+
+def _build(post_id):
+    # Только из default: копия с отстающей реплики пережила бы сброс.
+    # Поколения читаем до данных: со сбросом между чтениями объект
+    # получит старые поколения, и load его не примет
+    posts = Post.objects.using(DEFAULT_DB_ALIAS).filter(pk=post_id)
+    keys = posts.values_list('author_id', 'group_id').first()
+    if keys is None:
+        return None
+    versions = get_versions(*_scopes(*keys))
+    # Хэш пароля автора в общий кэш не кладем
+    post = posts.select_related('author__stats', 'group').defer(
+        'author__password').first()
+    if post is None:
+        return None
+    if keys != (post.author_id, post.group_id):
+        # Пост перенесли между чтениями - поколения не те, читаем заново
+        return _build(post_id)
+    # Шаблон читает post.author.stats
+    counters.user_stats(post.author)
+    per_page = settings.COMMENTS_PER_PAGE
+    comments = list(
+        comments_for(post_id).using(DEFAULT_DB_ALIAS)[:per_page + 1])
+    return {
+        'post': post,
+        'comments': comments[:per_page],
+        'has_next': len(comments) > per_page,
+        'versions': versions,
+    }
+
+
+def load(post_id):
+    """Пост с первой порцией комментариев или None, если поста нет."""
+    key = BUNDLE_KEY.format(post_id)
+    bundle = cache.get(key)
+    if bundle is not None and get_versions(
+            *bundle['versions']) == bundle['versions']:
+        stats.count('hits')
+        return bundle
+    stats.count('misses')
+    bundle = _build(post_id)
+    if bundle is not None:
+        cache.set(key, bundle, settings.POST_BUNDLE_TIMEOUT)
+    return bundle
+
+
+def forget(*post_ids):
+    cache.delete_many([BUNDLE_KEY.format(post_id) for post_id in post_ids])
@@ -0,0 +1,252 @@
+"""Кэш страниц с поколениями вместо короткого TTL.
+
+Каждая область кэша (лента, группа, профиль) имеет номер поколения,
+который входит в ключ закэшированной страницы. Сигналы моделей
+увеличивают номер, и старые страницы перестают читаться сразу,
+поэтому сам кэш может жить часами.
+
+Общая копия страницы (shared_cache_page) отдается по схеме
+stale-while-revalidate: копия свежая PAGE_CACHE_FRESH_TIMEOUT секунд
+и пока поколение не сменилось, потом она устаревшая, но лежит в кэше
+до PAGE_CACHE_TIMEOUT. Устаревшую копию перестраивает один воркер,
+взявший аренду (cache.add), остальные в это время отдают старую.
+"""
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import cache_page
+
+from . import replicas, thumbnails
+from .fragments import punch_holes
+from .stats import Stats
+
+VERSION_KEY = 'cache_version:{}'
+# Время последней смены поколения, для Last-Modified (posts.conditional)
+MODIFIED_KEY = 'cache_modified:{}'
+PAGE_KEY = 'shared_page:{}:{}'
+LEASE_KEY = 'shared_page_lease:{}'
+# Пауза между проверками, пока другой воркер строит первую копию
+LEASE_POLL = 0.05
+
+# fresh - свежая копия, stale - устаревшая, пока ее перестраивает
+# другой воркер, render - страница отрендерена, waited - воркер
+# дождался первой копии, которую строил другой
+stats = Stats('shared_pages', ('fresh', 'stale', 'render', 'waited'))
+
+
+def page_cache_stats():
+    """Отдачи общих копий в этом процессе, как KVStore.stats()."""
+    return stats.local()
+
+
+def reset_page_cache_stats():
+    stats.reset()
+
+
+def _initial_version():
+    # Версия, потерянная при вытеснении, не должна совпасть со старой
+    return int(time.time() * 1000)
+
+
+def get_versions(*scopes):
+    """Текущие поколения областей кэша, одним запросом к кэшу."""
+    keys = {VERSION_KEY.format(scope): scope for scope in scopes}
+    found = cache.get_many(keys)
+    versions = {}
+    for key, scope in keys.items():
+        if key not in found:
+            # Новое поколение началось сейчас
+            if cache.add(key, _initial_version(), None):
+                cache.set(MODIFIED_KEY.format(scope), time.time(), None)
+            found[key] = cache.get(key)
+        versions[scope] = found[key]
+    return versions
+
+
+def bump(*scopes):
+    """Начинает новое поколение: все страницы областей устаревают."""
+    scopes = set(scopes)
+    for scope in scopes:
+        key = VERSION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), None)
+    now = time.time()
+    cache.set_many(
+        {MODIFIED_KEY.format(scope): now for scope in scopes}, None)
+
+
+def last_modified(*scopes):
+    """Время последней смены поколений или None, если оно неизвестно."""
+    keys = [MODIFIED_KEY.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    if not keys or len(found) < len(keys):
+        return None
+    return max(found.values())
+
+
+def _versions_digest(scopes, kwargs):
+    names = [scope.format(**kwargs) for scope in scopes]
+    versions = sorted(get_versions(*names).items())
+    return hashlib.md5(repr(versions).encode()).hexdigest()
+
+
+def render_cacheable(view, request, *args, **kwargs):
+    """Вызывает view и сообщает, можно ли кэшировать ответ.
+
+    Страницу с заглушками миниатюр не кэшируем: иначе заглушки
+    провисели бы до следующей смены поколения. Копия ляжет под текущее
+    поколение и уйдет всем, в том числе только что писавшему клиенту,
+    поэтому читается она из default, а не с отстающей реплики.
+    """
+    thumbnails.reset_placeholders()
+    with replicas.primary():
+        response = view(request, *args, **kwargs)
+    cacheable = (response.status_code == 200 and not response.streaming
+                 and not thumbnails.placeholders_rendered())
+    return response, cacheable
+
+
+def _uncached_placeholders(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response, cacheable = render_cacheable(view, request, *args, **kwargs)
+        if not cacheable:
+            patch_cache_control(response, private=True)
+        return response
+    return wrapper
+
+
+def versioned_cache_page(*scopes, timeout=None):
+    """cache_page, ключ которого зависит от поколений областей.
+
+    Области задаются шаблонами строк с именованными аргументами view:
+    @versioned_cache_page('group:{slug}').
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            prefix = _versions_digest(scopes, kwargs)
+            cached_view = cache_page(
+                timeout or settings.PAGE_CACHE_TIMEOUT,
+                key_prefix=f'{view.__name__}.{prefix}',
+            )(_uncached_placeholders(view))
+            return cached_view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def page_key(name, url):
+    """Ключ общей копии страницы view name по полному URL."""
+    return PAGE_KEY.format(name, hashlib.md5(url.encode()).hexdigest())
+
+
+def _serve(cached, request):
+    digest, fresh_until, content, content_type = cached
+    response = HttpResponse(content_type=content_type)
+    response.content = punch_holes(content, request)
+    return response
+
+
+def _render(view, request, key, digest, timeout, args, kwargs):
+    """Рендерит общую копию и кладет ее в кэш, если можно."""
+    stats.count('render')
+    request.shared_render = True
+    response, cacheable = render_cacheable(view, request, *args, **kwargs)
+    request.shared_render = False
+    if not cacheable:
+        if not response.streaming:
+            response.content = punch_holes(
+                response.content.decode(response.charset), request)
+        return response
+    cached = (digest, time.time() + settings.PAGE_CACHE_FRESH_TIMEOUT,
+              response.content.decode(response.charset),
+              response['Content-Type'])
+    cache.set(key, cached, timeout or settings.PAGE_CACHE_TIMEOUT)
+    return _serve(cached, request)
+
+
+def _wait_for(key, lease):
+    """Первая копия, которую строит другой воркер, или None.
+
+    Аренда снята, а копии нет - значит, ответ не кэшируется (заглушки
+    миниатюр, ошибка), и ждать до PAGE_CACHE_LEASE_WAIT незачем.
+    """
+    deadline = time.monotonic() + settings.PAGE_CACHE_LEASE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LEASE_POLL)
+        found = cache.get_many([key, lease])
+        if key in found:
+            return found[key]
+        if lease not in found:
+            return None
+    return None
+
+
+def _revalidate(view, request, key, digest, timeout, args, kwargs):
+    cached = cache.get(key)
+    if cached is not None and cached[0] == digest \
+            and cached[1] > time.time():
+        stats.count('fresh')
+        return _serve(cached, request)
+    lease = LEASE_KEY.format(key)
+    token = uuid.uuid4().hex
+    if cache.add(lease, token, settings.PAGE_CACHE_LEASE_TIMEOUT):
+        try:
+            return _render(
+                view, request, key, digest, timeout, args, kwargs)
+        finally:
+            # Аренду могли перехватить по таймауту - чужую не снимаем
+            if cache.get(lease) == token:
+                cache.delete(lease)
+    if cached is None:
+        cached = _wait_for(key, lease)
+        if cached is None:
+            return _render(
+                view, request, key, digest, timeout, args, kwargs)
+        stats.count('waited')
+        return _serve(cached, request)
+    stats.count('stale')
+    response = _serve(cached, request)
+    # Устаревшую копию клиенту хранить незачем: ETag (posts.conditional)
+    # посчитан по новым поколениям и закрепил бы старое содержимое
+    patch_cache_control(response, no_store=True)
+    return response
+
+
+def shared_cache_page(*scopes, timeout=None):
+    """Одна закэшированная копия страницы для всех пользователей.
+
+    View рендерится с маркерами вместо персональных фрагментов
+    ({% fragment %}), копия кладется в кэш без учета cookie, а маркеры
+    заполняются на каждом запросе. Устаревшая копия (новое поколение
+    или истек PAGE_CACHE_FRESH_TIMEOUT) отдается, пока ее перестраивает
+    другой воркер. timeout - срок, после которого копия удаляется
+    совсем. При PAGE_CACHE_SHARED = False работает как
+    versioned_cache_page, то есть копия на сессию.
+    """
+    def decorator(view):
+        per_session_view = versioned_cache_page(
+            *scopes, timeout=timeout)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not settings.PAGE_CACHE_SHARED:
+                return per_session_view(request, *args, **kwargs)
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            # Поколения не входят в ключ: по старой копии можно ответить,
+            # пока строится новая
+            key = page_key(view.__name__, request.build_absolute_uri())
+            return _revalidate(
+                view, request, key, _versions_digest(scopes, kwargs),
+                timeout, args, kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,64 @@
+"""Карточки постов в лентах, закэшированные по одной.
+
+Страница ленты целиком лежит в кэше (posts.cache), но после смены
+поколения рендерится заново вся. Карточка поста кэшируется отдельно
+с ключом из id поста, его updated_at и поколений автора и группы,
+поэтому новая страница собирается из готовых карточек, а правка поста
+рендерит только его карточку. Поколения автора и группы увеличивают
+сигналы при смене имени автора или названия группы.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from . import thumbnails
+from .cache import get_versions
+
+CARD_KEY = 'post_card:{}:{}:{}:{}'
+AUTHOR_SCOPE = 'card_author:{}'
+GROUP_SCOPE = 'card_group:{}'
+
+
+def _scopes(post):
+    scopes = [AUTHOR_SCOPE.format(post.author_id)]
+    if post.group_id is not None:
+        scopes.append(GROUP_SCOPE.format(post.group_id))
+    return scopes
+
+
+def card_key(post, versions):
+    return CARD_KEY.format(
+        post.pk,
+        post.updated_at.timestamp(),
+        versions[AUTHOR_SCOPE.format(post.author_id)],
+        versions.get(GROUP_SCOPE.format(post.group_id), ''),
+    )
+
+
+def render_cards(posts, request=None):
+    """HTML карточек постов: из кэша, недостающие - рендером.
+
+    Поколения и готовые карточки читаются одним get_many каждые,
+    записи миниатюр для недостающих карточек - одной пачкой.
+    Карточку с заглушкой миниатюры не кэшируем, как и страницу.
+    """
+    posts = list(posts)
+    versions = get_versions(
+        *{scope for post in posts for scope in _scopes(post)})
+    keys = [card_key(post, versions) for post in posts]
+    found = cache.get_many(keys)
+    thumbnails.prefetch(
+        [post for post, key in zip(posts, keys) if key not in found])
+    missing = {}
+    cards = []
+    for post, key in zip(posts, keys):
+        if key not in found:
+            placeholders = thumbnails.placeholders_rendered()
+            found[key] = render_to_string(
+                'includes/post_card.html', {'post': post}, request=request)
+            if thumbnails.placeholders_rendered() == placeholders:
+                missing[key] = found[key]
+        cards.append(found[key])
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_TIMEOUT)
+    return cards
@@ -0,0 +1,90 @@
+"""Условные GET для лент и страницы поста.
+
+ETag и Last-Modified считаются до рендера: для лент - по поколениям
+областей кэша (posts.cache), для страницы поста - по закэшированному
+посту (posts.bundles). Пока страница не менялась, клиент с
+If-None-Match или If-Modified-Since получает 304 без выборки постов
+и шаблонов. На страницах есть персональные фрагменты, поэтому
+пользователь входит в ETag, а сам ETag слабый: он описывает данные
+страницы, а не ее байты.
+"""
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import bundles, thumbnails
+from .cache import get_versions, last_modified
+
+
+def _etag(request, *parts):
+    user = request.user
+    viewer = (user.pk, user.get_username()) if user.is_authenticated else None
+    digest = hashlib.md5(
+        repr((parts, viewer, request.get_full_path())).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def generation_validators(*scopes):
+    """Валидаторы ленты по областям кэша, как у shared_cache_page.
+
+    В шаблонах областей доступны аргументы view и {user} - id
+    текущего пользователя.
+    """
+    def validators(request, *args, **kwargs):
+        names = [scope.format(user=request.user.pk, **kwargs)
+                 for scope in scopes]
+        versions = sorted(get_versions(*names).items())
+        return _etag(request, versions), last_modified(*names)
+    return validators
+
+
+def post_validators(request, post_id):
+    """Валидаторы post_detail: правка поста, комментарии, счетчики."""
+    bundle = bundles.load(post_id)
+    # Второй раз кэш view не читает
+    request.post_bundle = bundle
+    if bundle is None:
+        return None, None
+    post = bundle['post']
+    modified = post.updated_at
+    newest = None
+    if bundle['comments']:
+        newest = bundle['comments'][0]
+        modified = max(modified, newest.created)
+    etag = _etag(
+        request, post.pk, post.updated_at, post.comments_count,
+        newest and newest.pk, sorted(bundle['versions'].items()))
+    return etag, modified.timestamp()
+
+
+def conditional_page(validators):
+    """Отвечает 304, если валидаторы совпали с заголовками запроса.
+
+    Иначе рендерит view и добавляет ETag и Last-Modified к ответу 200.
+    Страницы с заглушками миниатюр и ответы с no-store (устаревшая
+    копия из кэша) уходят без валидаторов.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            etag, modified = validators(request, *args, **kwargs)
+            modified = modified and int(modified)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=modified)
+            if response is not None:
+                return response
+            thumbnails.reset_placeholders()
+            response = view(request, *args, **kwargs)
+            if (etag and response.status_code == 200
+                    and not thumbnails.placeholders_rendered()
+                    and 'no-store' not in response.get('Cache-Control', '')):
+                response['ETag'] = etag
+                if modified:
+                    response['Last-Modified'] = http_date(modified)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,132 @@
+"""Денормализованные счетчики постов, комментариев и подписок.
+
+Счетчики меняются атомарным UPDATE ... SET n = n + 1 из сигналов
+моделей Post, Comment и Follow; страницы читают готовые значения
+вместо COUNT(*). Расхождения чинит команда recount_stats.
+
+Число постов в ленте и в группе хранится в кэше: промах считается
+одним COUNT(*), дальше значение сдвигают сигналы, а TTL со временем
+исправляет накопившуюся погрешность.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def _subquery_count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by().values(field).annotate(n=Count('pk')).values('n')
+    ), 0)
+
+
+def exact_user_stats(user_ids):
+    """Пересчитывает счетчики пользователей по таблицам."""
+    return User.objects.filter(pk__in=user_ids).annotate(
+        posts_total=_subquery_count(Post.objects.all(), 'author'),
+        followers_total=_subquery_count(Follow.objects.all(), 'author'),
+        following_total=_subquery_count(Follow.objects.all(), 'user'),
+    ).values_list('pk', 'posts_total', 'followers_total', 'following_total')
+
+
+def rebuild_user_stats(user_ids):
+    """Записывает точные счетчики для пачки пользователей."""
+    existing = dict(UserStats.objects.filter(
+        user_id__in=user_ids).values_list('user_id', 'pk'))
+    stats = [
+        UserStats(pk=existing.get(user_id), user_id=user_id,
+                  posts_count=posts, followers_count=followers,
+                  following_count=following)
+        for user_id, posts, followers, following
+        in exact_user_stats(user_ids)
+    ]
+    UserStats.objects.bulk_create(
+        [stat for stat in stats if stat.pk is None])
+    UserStats.objects.bulk_update(
+        [stat for stat in stats if stat.pk is not None],
+        ['posts_count', 'followers_count', 'following_count'],
+    )
+    return len(stats)
+
+
+def user_stats(user):
+    """Счетчики пользователя.
+
+    Строки может не быть: loaddata и другие raw-сохранения пропускают
+    сигнал, который ее создает. Тогда она создается пересчетом:
+    один запрос на точные значения и один INSERT. Строку, которую успел
+    создать параллельный запрос, INSERT пропускает, а значения и так
+    точные.
+    """
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        _, posts, followers, following = exact_user_stats(
+            [user.pk]).using(DEFAULT_DB_ALIAS).get()
+        stats = UserStats(
+            user_id=user.pk, posts_count=posts,
+            followers_count=followers, following_count=following)
+        UserStats.objects.bulk_create([stats], ignore_conflicts=True)
+        user.stats = stats
+        return stats
+
+
+def rebuild_comments_count(post_ids):
+    """Записывает точное число комментариев для пачки постов."""
+    return Post.objects.filter(pk__in=post_ids).update(
+        comments_count=_subquery_count(Comment.objects.all(), 'post'))
+
+
+def change_user_stats(user_id, field, delta):
+    """Сдвигает счетчик пользователя.
+
+    Если строки счетчиков нет, при увеличении она создается пересчетом.
+    Уменьшение ниже нуля пропускается: такое расхождение исправит
+    recount_stats, а строки удаляемого каскадом автора трогать нельзя.
+    """
+    stats = UserStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        stats = stats.filter(**{f'{field}__gte': -delta})
+    updated = stats.update(**{field: F(field) + delta})
+    if not updated and delta > 0:
+        rebuild_user_stats([user_id])
+
+
+def change_comments_count(post_id, delta):
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comments_count__gte=-delta)
+    posts.update(comments_count=F('comments_count') + delta)
+
+
+LISTING_COUNT_KEY = 'listing_count:{}'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def listing_count(scope, queryset):
+    """Примерное число постов области: 'all' или group_scope(id)."""
+    key = LISTING_COUNT_KEY.format(scope)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.LISTING_COUNT_TIMEOUT)
+    return max(count, 0)
+
+
+def change_listing_count(scope, delta):
+    # Отсутствующий счетчик не заводим: его посчитает следующее чтение
+    try:
+        cache.incr(LISTING_COUNT_KEY.format(scope), delta)
+    except ValueError:
+        pass
+
+
+def forget_listing_counts(*scopes):
+    cache.delete_many([LISTING_COUNT_KEY.format(scope) for scope in scopes])
@@ -0,0 +1,89 @@
+"""Потоковая выгрузка постов автора или группы с комментариями.
+
+Посты и комментарии читаются двумя .iterator() в порядке id поста и
+сливаются на лету, каждая запись сразу превращается в строку JSONL или
+CSV. Память не зависит от объема выгрузки: в ней одна пачка строк
+курсора и одна запись.
+"""
+import csv
+import json
+
+from .models import Comment
+
+FIELDS = ['type', 'id', 'post', 'author', 'group', 'created', 'text',
+          'image']
+CHUNK_SIZE = 500
+
+
+def post_record(post, image_url):
+    return {
+        'type': 'post',
+        'id': post.pk,
+        'post': None,
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'created': post.pub_date.isoformat(),
+        'text': post.text,
+        'image': image_url(post.image.url) if post.image else None,
+    }
+
+
+def comment_record(comment):
+    return {
+        'type': 'comment',
+        'id': comment.pk,
+        'post': comment.post_id,
+        'author': comment.author.username,
+        'group': None,
+        'created': comment.created.isoformat(),
+        'text': comment.text,
+        'image': None,
+    }
+
+
+def records(posts, image_url=str, chunk_size=CHUNK_SIZE):
+    """Записи постов, за каждым постом - его комментарии."""
+    posts = posts.select_related('author', 'group').order_by('pk')
+    comments = (
+        Comment.objects.filter(post__in=posts.values('pk'))
+        .select_related('author').order_by('post_id', 'created', 'pk')
+        .iterator(chunk_size=chunk_size)
+    )
+    comment = next(comments, None)
+    for post in posts.iterator(chunk_size=chunk_size):
+        yield post_record(post, image_url)
+        # Комментарии к постам, появившимся между запросами, пропускаем
+        while comment is not None and comment.post_id <= post.pk:
+            if comment.post_id == post.pk:
+                yield comment_record(comment)
+            comment = next(comments, None)
+
+
+def jsonl_lines(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+class Echo:
+    """Файл для csv.writer, который отдает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(records):
+    writer = csv.DictWriter(Echo(), fieldnames=FIELDS)
+    yield writer.writeheader()
+    for record in records:
+        yield writer.writerow(record)
+
+
+FORMATS = {
+    'jsonl': (jsonl_lines, 'application/x-ndjson'),
+    'csv': (csv_lines, 'text/csv'),
+}
+
+
+def export_lines(posts, format, image_url=str, chunk_size=CHUNK_SIZE):
+    lines, content_type = FORMATS[format]
+    return lines(records(posts, image_url, chunk_size))
@@ -0,0 +1,61 @@
+"""Персональные фрагменты страниц, которые вставляются в общий кэш.
+
+Страница, закэшированная одна на всех, рендерится с маркерами вместо
+зависящих от пользователя кусков (шапка, кнопка подписки, ссылка на
+редактирование). На каждом запросе маркеры заменяются фрагментами,
+отрендеренными для текущего пользователя.
+"""
+import base64
+import json
+import re
+
+from django.template.loader import render_to_string
+
+from .models import Follow
+
+MARKER = '<!--fragment:{}:{}-->'
+MARKER_RE = re.compile(r'<!--fragment:([\w-]+):([\w=-]*)-->')
+
+
+def follow_button_context(request, author):
+    user = request.user
+    following = user.is_authenticated and Follow.objects.filter(
+        user=user, author__username=author).exists()
+    return {'author_username': author, 'following': following}
+
+
+def edit_link_context(request, post_id, author_id):
+    return {
+        'post_id': post_id,
+        'can_edit': request.user.is_authenticated
+        and request.user.pk == author_id,
+    }
+
+
+FRAGMENTS = {
+    'header': ('includes/header.html', None),
+    'switcher': ('includes/switcher.html', None),
+    'follow_button': ('includes/follow_button.html', follow_button_context),
+    'edit_link': ('includes/edit_link.html', edit_link_context),
+}
+
+
+def render_fragment(name, request, params):
+    template, get_context = FRAGMENTS[name]
+    context = get_context(request, **params) if get_context else params
+    return render_to_string(template, context, request=request)
+
+
+def marker(name, params):
+    payload = base64.urlsafe_b64encode(
+        json.dumps(params, separators=(',', ':')).encode()).decode()
+    return MARKER.format(name, payload)
+
+
+def punch_holes(content, request):
+    """Заменяет маркеры в общей странице фрагментами пользователя."""
+    def fill(match):
+        name, payload = match.groups()
+        params = json.loads(base64.urlsafe_b64decode(payload.encode()))
+        return render_fragment(name, request, params)
+    return MARKER_RE.sub(fill, content)
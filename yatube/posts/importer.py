@@ -0,0 +1,340 @@
+"""Потоковый импорт постов, комментариев и подписок.
+
+Строки JSONL/CSV читаются генератором и не собираются в память целиком.
+Ссылки на авторов (username), группы (slug) и посты (id) разрешаются
+одним запросом на пачку, записи пишутся bulk_create. Сигналы при этом
+не срабатывают, поэтому счетчики, ленты, поисковый индекс и кэш
+страниц обновляются здесь же, пачками, в той же транзакции.
+
+Форматы строк:
+    posts:    text, author, group?, pub_date?, image?, id?
+    comments: post, author, text, created?
+    follows:  user, author
+"""
+import csv
+import json
+from contextlib import contextmanager
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import bundles, cache, counters, search, timeline
+from .models import Comment, Follow, Group, Post, User, make_excerpt
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def read_rows(path, format):
+    """Строки файла как словари, по одной."""
+    with open(path, newline='', encoding='utf-8') as source:
+        if format == 'csv':
+            yield from csv.DictReader(source)
+            return
+        for line in source:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Битая строка не останавливает импорт, ее пропустит
+                # Importer, а номер строки для отметки сохранится
+                yield None
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def parse_date(value):
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise InvalidRow(f'Неверная дата: {value}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.utc)
+    return date
+
+
+def required(row, field):
+    value = row.get(field)
+    if value in (None, ''):
+        raise InvalidRow(f'Нет поля {field}')
+    return value
+
+
+@contextmanager
+def keep_dates(model, name):
+    """Дает записать дату из файла в поле с auto_now_add."""
+    if name is None:
+        yield
+        return
+    field = model._meta.get_field(name)
+    auto_now_add = field.auto_now_add
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = auto_now_add
+
+
+class Importer:
+    """Импорт одной модели: строки пачки -> объекты -> bulk_create."""
+
+    model = None
+    date_field = None
+
+    def __init__(self, batch_size=1000, create_users=False):
+        self.batch_size = batch_size
+        self.create_users = create_users
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+
+    def users(self, usernames):
+        """username -> id для пачки, недостающих создает по флагу."""
+        usernames = {username for username in usernames if username}
+        found = dict(User.objects.filter(
+            username__in=usernames).values_list('username', 'id'))
+        missing = set(usernames) - set(found)
+        if missing and self.create_users:
+            User.objects.bulk_create(
+                [User(username=username, password=make_password(None))
+                 for username in missing],
+                ignore_conflicts=True,
+            )
+            created = dict(User.objects.filter(
+                username__in=missing).values_list('username', 'id'))
+            self.new_user_ids.update(created.values())
+            found.update(created)
+        return found
+
+    def build(self, rows):
+        """Объекты модели для пачки строк; битые строки пропускаются."""
+        raise NotImplementedError
+
+    def before_chunk(self):
+        """Вызывается в начале транзакции пачки."""
+
+    def after_chunk(self, objects):
+        """Обновляет то, что обычно поддерживают сигналы модели."""
+
+    def skip(self, row, error):
+        self.skipped += 1
+        self.errors.append((row, str(error)))
+
+    def import_chunk(self, rows):
+        """Пишет строки одной транзакцией, пачками по batch_size."""
+        self.new_user_ids = set()
+        objects = []
+        self.errors = []
+        with transaction.atomic(), keep_dates(self.model, self.date_field):
+            self.before_chunk()
+            for batch in chunked(rows, self.batch_size):
+                for row in batch:
+                    if not isinstance(row, dict):
+                        self.skip(row, InvalidRow('Неверная строка'))
+                built = self.build(
+                    [row for row in batch if isinstance(row, dict)])
+                self.bulk_create(built)
+                objects.extend(built)
+            self.after_chunk(objects)
+            if self.new_user_ids:
+                counters.rebuild_user_stats(list(self.new_user_ids))
+        self.created += len(objects)
+        return len(objects)
+
+    def bulk_create(self, objects):
+        # Размер INSERT выбирает Django: явный batch_size в Django 2.2
+        # перекрывает лимит SQLite на число строк в одном запросе
+        self.model.objects.bulk_create(objects)
+
+
+class PostImporter(Importer):
+    model = Post
+    date_field = 'pub_date'
+
+    def taken(self, rows):
+        """Запоминает явные id пачки, которые уже заняты в базе."""
+        ids = {int(row['id']) for row in rows
+               if str(row.get('id') or '').isdigit()}
+        self.taken_ids.update(
+            Post.objects.filter(pk__in=ids).values_list('pk', flat=True))
+
+    def post_id(self, row):
+        post_id = row.get('id') or None
+        if post_id is None:
+            return None
+        if not str(post_id).isdigit():
+            raise InvalidRow(f'Неверный id: {post_id}')
+        post_id = int(post_id)
+        if post_id in self.taken_ids:
+            raise InvalidRow(f'Пост с id {post_id} уже есть')
+        self.taken_ids.add(post_id)
+        return post_id
+
+    def build(self, rows):
+        users = self.users({row.get('author') for row in rows})
+        groups = dict(Group.objects.filter(
+            slug__in={row.get('group') for row in rows if row.get('group')}
+        ).values_list('slug', 'id'))
+        self.taken(rows)
+        posts = []
+        for row in rows:
+            try:
+                author = required(row, 'author')
+                if author not in users:
+                    raise InvalidRow(f'Нет автора {author}')
+                group = row.get('group') or None
+                if group is not None and group not in groups:
+                    raise InvalidRow(f'Нет группы {group}')
+                text = required(row, 'text')
+                pub_date = parse_date(row.get('pub_date'))
+                posts.append(Post(
+                    # id занимается последним, когда строка уже проверена
+                    id=self.post_id(row),
+                    text=text,
+                    # bulk_create не вызывает save(), отрывок - здесь
+                    excerpt=make_excerpt(text),
+                    author_id=users[author],
+                    group_id=groups.get(group),
+                    pub_date=pub_date,
+                    image=row.get('image') or '',
+                ))
+            except InvalidRow as error:
+                self.skip(row, error)
+        return posts
+
+    def before_chunk(self):
+        # bulk_create на SQLite не возвращает id. Транзакция начата с
+        # BEGIN IMMEDIATE (core.db.sqlite), и чужие вставки ждут ее
+        # конца, поэтому новые посты - это явно заданные id и все, что
+        # выше нынешнего максимума
+        self.last_pk = Post.objects.aggregate(last=Max('pk'))['last'] or 0
+        self.taken_ids = set()
+
+    def after_chunk(self, posts):
+        post_ids = {post.pk for post in posts if post.pk is not None}
+        post_ids.update(Post.objects.filter(
+            pk__gt=self.last_pk).values_list('pk', flat=True))
+        post_ids = sorted(post_ids)
+        author_ids = list({post.author_id for post in posts})
+        for ids in chunked(author_ids, self.batch_size):
+            counters.rebuild_user_stats(ids)
+        for ids in chunked(post_ids, self.batch_size):
+            timeline.fan_out_many(ids)
+            search.index_posts(ids)
+        scopes = {'index'}
+        scopes.update(
+            bundles.AUTHOR_POSTS_SCOPE.format(author_id)
+            for author_id in author_ids)
+        scopes.update(
+            f'profile:{username}' for username in User.objects.filter(
+                pk__in=author_ids).values_list('username', flat=True))
+        scopes.update(
+            f'group:{slug}' for slug in Group.objects.filter(
+                pk__in={post.group_id for post in posts}
+            ).values_list('slug', flat=True))
+        counts = {'all'}
+        counts.update(counters.group_scope(post.group_id)
+                      for post in posts if post.group_id is not None)
+        transaction.on_commit(lambda: cache.bump(*scopes))
+        transaction.on_commit(lambda: counters.forget_listing_counts(*counts))
+
+
+class CommentImporter(Importer):
+    model = Comment
+    date_field = 'created'
+
+    def build(self, rows):
+        users = self.users({row.get('author') for row in rows})
+        post_ids = set()
+        for row in rows:
+            try:
+                post_ids.add(int(row.get('post')))
+            except (TypeError, ValueError):
+                pass
+        posts = set(Post.objects.filter(
+            pk__in=post_ids).values_list('pk', flat=True))
+        comments = []
+        for row in rows:
+            try:
+                author = required(row, 'author')
+                if author not in users:
+                    raise InvalidRow(f'Нет автора {author}')
+                post = required(row, 'post')
+                if not str(post).isdigit() or int(post) not in posts:
+                    raise InvalidRow(f'Нет поста {post}')
+                comments.append(Comment(
+                    post_id=int(post),
+                    author_id=users[author],
+                    text=required(row, 'text'),
+                    created=parse_date(row.get('created')),
+                ))
+            except InvalidRow as error:
+                self.skip(row, error)
+        return comments
+
+    def after_chunk(self, comments):
+        post_ids = list({comment.post_id for comment in comments})
+        for ids in chunked(post_ids, self.batch_size):
+            counters.rebuild_comments_count(ids)
+        transaction.on_commit(lambda: bundles.forget(*post_ids))
+
+
+class FollowImporter(Importer):
+    model = Follow
+
+    def build(self, rows):
+        users = self.users(
+            {row.get(field) for row in rows for field in ('user', 'author')})
+        follows = []
+        for row in rows:
+            try:
+                user = required(row, 'user')
+                author = required(row, 'author')
+                for username in (user, author):
+                    if username not in users:
+                        raise InvalidRow(f'Нет пользователя {username}')
+                if user == author:
+                    raise InvalidRow('Подписка на самого себя')
+                follows.append(
+                    Follow(user_id=users[user], author_id=users[author]))
+            except InvalidRow as error:
+                self.skip(row, error)
+        return follows
+
+    def bulk_create(self, follows):
+        # Повторная подписка из файла - не ошибка, ее пропускает UNIQUE
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+
+    def after_chunk(self, follows):
+        user_ids = list(
+            {follow.user_id for follow in follows}
+            | {follow.author_id for follow in follows})
+        for ids in chunked(user_ids, self.batch_size):
+            counters.rebuild_user_stats(ids)
+        for batch in chunked(follows, self.batch_size):
+            timeline.backfill_many(batch)
+        author_ids = {follow.author_id for follow in follows}
+        scopes = {
+            f'profile:{username}' for username in User.objects.filter(
+                pk__in=author_ids).values_list('username', flat=True)
+        }
+        scopes.update(f'follows:{follow.user_id}' for follow in follows)
+        transaction.on_commit(lambda: cache.bump(*scopes))
+
+
+IMPORTERS = {
+    'posts': PostImporter,
+    'comments': CommentImporter,
+    'follows': FollowImporter,
+}
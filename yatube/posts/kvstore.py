@@ -0,0 +1,103 @@
+"""KVStore sorl-thumbnail с LRU в памяти процесса.
+
+Каждый {% thumbnail %} ищет миниатюру в key-value хранилище. Горячие
+ключи читаются из ограниченного LRU без обращения к кэшу и базе,
+промахи уходят в общий cached_db KVStore.
+
+LRU у каждого процесса свой: удаление сбрасывает запись в базе, общем
+кэше и LRU своего процесса, а другие процессы могут отдавать ее еще
+до THUMBNAIL_LRU_TTL секунд. Миниатюры удаляются вместе с картинкой
+поста, которую к этому времени страницы уже не показывают, поэтому
+короткий TTL дешевле общего поколения, которое стоило бы обращения к
+кэшу на каждый {% thumbnail %}. Ленты заранее читают записи
+своих миниатюр через prefetch: один get_many и один запрос на страницу
+вместо запроса на каждую карточку.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    def __init__(self):
+        super().__init__()
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key, value):
+        expires = time.monotonic() + settings.THUMBNAIL_LRU_TTL
+        with self._lock:
+            self._lru[key] = (value, expires)
+            self._lru.move_to_end(key)
+            while len(self._lru) > settings.THUMBNAIL_LRU_SIZE:
+                self._lru.popitem(last=False)
+
+    def _forget(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._lru.pop(key, None)
+
+    def _get_raw(self, key):
+        with self._lock:
+            value, expires = self._lru.get(key, (None, 0))
+            if expires > time.monotonic():
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return value
+            self._lru.pop(key, None)
+            self.misses += 1
+        value = super()._get_raw(key)
+        # Промахи не запоминаем: миниатюру может дописать воркер
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self._remember(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        self._forget(*keys)
+
+    def prefetch(self, image_files):
+        """Загружает записи image_files в LRU и кэш пачкой.
+
+        Отсутствующие записи кэшируются как пустые, как это делает
+        _get_raw, поэтому их следующее чтение тоже не идет в базу.
+        """
+        now = time.monotonic()
+        with self._lock:
+            keys = [add_prefix(image_file.key) for image_file in image_files]
+            keys = [key for key in keys
+                    if self._lru.get(key, (None, 0))[1] <= now]
+        if not keys:
+            return
+        found = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            rows = dict(KVStoreModel.objects.filter(
+                key__in=missing).values_list('key', 'value'))
+            loaded = {key: rows.get(key, cached_db_kvstore.EMPTY_VALUE)
+                      for key in missing}
+            self.cache.set_many(loaded, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            found.update(loaded)
+        for key, value in found.items():
+            if value != cached_db_kvstore.EMPTY_VALUE:
+                self._remember(key, value)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._lru),
+            }
@@ -0,0 +1,128 @@
+import json
+import os
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from core.cache import isolated_caches
+from posts import benchmark
+from posts.seeding import Shape, seed
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+DATASET = ('users', 'groups', 'posts', 'comments', 'follows')
+
+
+class Command(BaseCommand):
+    help = ('Заполняет отдельную базу данными и замеряет маршруты posts '
+            'под параллельной нагрузкой через WSGI-приложение')
+
+    def add_arguments(self, parser):
+        defaults = Shape()
+        for name in DATASET:
+            parser.add_argument(
+                f'--{name}', type=int, default=getattr(defaults, name))
+        parser.add_argument('--workers', type=int,
+                            help='Процессов генерации данных')
+        parser.add_argument(
+            '--routes', nargs='+', choices=sorted(benchmark.ROUTES),
+            default=sorted(benchmark.ROUTES))
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на каждый маршрут')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--database', default=os.path.join(
+                settings.BASE_DIR, 'bench.sqlite3'),
+            help='Файл базы для прогона, рабочая база не трогается')
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Не удалять базу и взять уже заполненную в следующий раз')
+        parser.add_argument('--output', default='bench-results.json')
+        parser.add_argument(
+            '--compare', help='JSON прошлого прогона для сравнения')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Прогон рассчитан на SQLite')
+        seeded = options['keep'] and os.path.exists(options['database'])
+        settings.DATABASES['default']['TEST'] = {'NAME': options['database']}
+        # Кэш свой, иначе прогон чистил бы и наполнял рабочий
+        with isolated_caches():
+            results = self.measure(options, seeded)
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {options["output"]}'))
+        if options['compare']:
+            with open(options['compare']) as previous:
+                ratios = benchmark.compare(json.load(previous), results)
+            for route, metrics in ratios.items():
+                self.stdout.write(f'{route}: ' + ', '.join(
+                    f'{metric} x{ratio:.2f}'
+                    for metric, ratio in metrics.items()))
+
+    def measure(self, options, seeded):
+        # destroy_test_db возвращает в настройки имя рабочей базы
+        old_name = settings.DATABASES['default']['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keep'])
+        try:
+            if not seeded:
+                self.seed(options)
+            # Замеряем как на проде: без DEBUG и учета запросов в логах
+            with override_settings(DEBUG=False, QUERY_COUNT_ENABLED=False):
+                return self.run(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keep'])
+
+    def seed(self, options):
+        started = time.monotonic()
+        seed(Shape(**{name: options[name] for name in DATASET}),
+             options['workers'])
+        self.stdout.write(
+            f'Данные созданы за {time.monotonic() - started:.1f} с')
+
+    def run(self, options):
+        from yatube.wsgi import application
+        sample = benchmark.Sample()
+        client = benchmark.Client(
+            application, benchmark.login_cookie(sample.reader))
+        results = {
+            'commit': current_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'dataset': {
+                name: options[name] for name in DATASET
+            },
+            'concurrency': options['concurrency'],
+            'routes': {},
+        }
+        for route in options['routes']:
+            cache.clear()
+            result = benchmark.run_route(
+                client, route, sample, options['requests'],
+                options['concurrency'])
+            results['routes'][route] = result
+            self.stdout.write(
+                f'{route}: p50 {result["p50_ms"]:.1f} мс, '
+                f'p95 {result["p95_ms"]:.1f} мс, '
+                f'p99 {result["p99_ms"]:.1f} мс, '
+                f'{result["throughput_rps"]:.0f} запр/с, '
+                f'{result["queries_per_request"]:.1f} SQL/ответ, '
+                f'ошибок {result["errors"]}'
+            )
+        return results
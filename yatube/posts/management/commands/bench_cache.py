@@ -0,0 +1,35 @@
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает бэкенды кэша под несколькими процессами: '
+            'скорость, общий hit rate и потерянные incr')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--operations', type=int, default=5000,
+                            help='Обращений к кэшу на процесс')
+        parser.add_argument('--keys', type=int, default=500)
+        parser.add_argument(
+            '--backends', nargs='+', choices=list(benchmark.CACHE_BACKENDS),
+            default=list(benchmark.CACHE_BACKENDS))
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        try:
+            for name in options['backends']:
+                result = benchmark.cache_workload(
+                    name, directory, options['processes'],
+                    options['operations'], options['keys'])
+                self.stdout.write(
+                    f'{name}: {result["ops_per_second"]:.0f} оп/с, '
+                    f'hit rate {result["hit_rate"]:.1%}, '
+                    f'счетчик {result["counter"]} '
+                    f'из {result["increments"]} incr')
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
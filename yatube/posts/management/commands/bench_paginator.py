@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Замеряет отрисовку includes/paginator.html при разном числе '
+            'страниц: время и размер не должны от него зависеть')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+',
+                            default=[10, 1000, 100000, 1000000])
+        parser.add_argument('--repeats', type=int, default=200)
+
+    def handle(self, *args, **options):
+        for pages in options['pages']:
+            result = benchmark.render_paginator(pages, options['repeats'])
+            self.stdout.write(
+                f'{result["pages"]} страниц: '
+                f'{result["render_ms"]:.3f} мс, {result["bytes"]} байт')
@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает стандартное подключение SQLite и core.db.sqlite '
+            'под параллельными читателями и писателями')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument(
+            '--configs', nargs='+', choices=sorted(benchmark.SQLITE_CONFIGS),
+            default=sorted(benchmark.SQLITE_CONFIGS))
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        try:
+            for name in options['configs']:
+                path = os.path.join(directory, f'{name}.sqlite3')
+                result = benchmark.sqlite_workload(
+                    name, path, options['readers'], options['writers'],
+                    options['seconds'])
+                for kind in ('read', 'write'):
+                    metrics = result[kind]
+                    self.stdout.write(
+                        f'{name} {kind}: '
+                        f'{metrics["ops_per_second"]:.0f} оп/с, '
+                        f'p95 {metrics["p95_ms"]:.1f} мс, '
+                        f'ошибок {metrics["errors"]}')
+        finally:
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts import bundles
+from posts import cache as page_cache
+
+STATS = (page_cache.stats, bundles.stats)
+
+
+class Command(BaseCommand):
+    help = ('Показывает счетчики общих копий страниц и кэша постов '
+            'по всем процессам')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счетчики после вывода')
+
+    def handle(self, *args, reset, **options):
+        for stats in STATS:
+            counts = stats.shared()
+            self.stdout.write(f'{stats.name}: ' + ', '.join(
+                f'{event} {count}' for event, count in counts.items()))
+            if reset:
+                stats.reset_shared()
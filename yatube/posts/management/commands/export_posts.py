@@ -0,0 +1,46 @@
+from urllib.parse import urljoin
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import CHUNK_SIZE, FORMATS, export_lines
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = ('Выгружает посты автора или группы с комментариями '
+            'в JSONL/CSV потоком, не загружая их в память')
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--author', help='username автора')
+        source.add_argument('--group', help='slug группы')
+        parser.add_argument(
+            '--format', choices=sorted(FORMATS), default='jsonl')
+        parser.add_argument(
+            '--output', help='Файл выгрузки, по умолчанию stdout')
+        parser.add_argument(
+            '--base-url', default='',
+            help='Адрес сайта для абсолютных ссылок на картинки')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, author, group, format, output, base_url,
+               chunk_size, **options):
+        if author is not None:
+            if not User.objects.filter(username=author).exists():
+                raise CommandError(f'Нет пользователя {author}')
+            posts = Post.objects.filter(author__username=author)
+        else:
+            if not Group.objects.filter(slug=group).exists():
+                raise CommandError(f'Нет группы {group}')
+            posts = Post.objects.filter(group__slug=group)
+        lines = export_lines(
+            posts, format, lambda url: urljoin(base_url, url), chunk_size)
+        if output is None:
+            self.write(lines, self.stdout)
+            return
+        with open(output, 'w', newline='', encoding='utf-8') as target:
+            self.write(lines, target)
+
+    def write(self, lines, target):
+        for line in lines:
+            target.write(line)
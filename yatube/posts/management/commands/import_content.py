@@ -0,0 +1,78 @@
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.importer import IMPORTERS, chunked, read_rows
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as checkpoint:
+            return int(checkpoint.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, rows):
+    # Через временный файл, чтобы прерванная запись не испортила отметку
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as checkpoint:
+        checkpoint.write(str(rows))
+    os.replace(temporary, path)
+
+
+class Command(BaseCommand):
+    help = ('Загружает посты, комментарии или подписки из JSONL/CSV '
+            'пачками bulk_create; прерванный импорт продолжается '
+            'с последней сохраненной отметки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['jsonl', 'csv'])
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--chunk-size', type=int, default=10000,
+            help='Строк в одной транзакции, отметка пишется после каждой')
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл отметки, по умолчанию <path>.checkpoint')
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать с начала файла, не глядя на отметку')
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='Создавать неизвестных пользователей без пароля')
+
+    def handle(self, *args, model, path, format, batch_size, chunk_size,
+               checkpoint, restart, create_users, **options):
+        if not os.path.exists(path):
+            raise CommandError(f'Файл не найден: {path}')
+        format = format or ('csv' if path.endswith('.csv') else 'jsonl')
+        checkpoint = checkpoint or f'{path}.checkpoint'
+        done = 0 if restart else read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f'Продолжаем со строки {done}')
+        importer = IMPORTERS[model](batch_size, create_users)
+        rows = islice(read_rows(path, format), done, None)
+        started = time.monotonic()
+        processed = 0
+        for chunk in chunked(rows, chunk_size):
+            importer.import_chunk(chunk)
+            done += len(chunk)
+            processed += len(chunk)
+            write_checkpoint(checkpoint, done)
+            if options['verbosity'] > 1:
+                for row, error in importer.errors:
+                    self.stderr.write(f'{error}: {row}')
+            elapsed = time.monotonic() - started
+            rate = processed / elapsed if elapsed else 0
+            self.stdout.write(
+                f'{done} строк, записано {importer.created}, '
+                f'пропущено {importer.skipped}, {rate:.0f} строк/с'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт {model} завершен: записано {importer.created}, '
+            f'пропущено {importer.skipped}'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import rebuild_comments_count, rebuild_user_stats
+from posts.models import Post, User
+
+
+def batches(queryset, size):
+    """Идет по первичным ключам пачками, не используя OFFSET."""
+    last_pk = 0
+    while True:
+        pks = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', flat=True)[:size]
+        )
+        if not pks:
+            return
+        yield pks
+        last_pk = pks[-1]
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счетчики постов, '
+            'комментариев и подписок')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        users = posts = 0
+        for pks in batches(User.objects.all(), batch_size):
+            with transaction.atomic():
+                users += rebuild_user_stats(pks)
+        for pks in batches(Post.objects.all(), batch_size):
+            with transaction.atomic():
+                posts += rebuild_comments_count(pks)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано пользователей: {users}, постов: {posts}'))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.seeding import Shape, seed
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, комментариями и подписками со степенным '
+            'распределением активности')
+
+    def add_arguments(self, parser):
+        defaults = Shape()
+        for name in ('users', 'groups', 'posts', 'comments', 'follows',
+                     'days', 'seed'):
+            parser.add_argument(
+                f'--{name}', type=int, default=getattr(defaults, name))
+        parser.add_argument(
+            '--alpha', type=float, default=defaults.alpha,
+            help='Показатель степенного закона, больше - неравномернее')
+        parser.add_argument(
+            '--images', type=float, default=defaults.images,
+            help='Доля постов с картинкой, от 0 до 1')
+        parser.add_argument(
+            '--password', help='Общий пароль пользователей, иначе без пароля')
+        parser.add_argument(
+            '--workers', type=int,
+            help='Процессов-генераторов, 0 - в текущем процессе')
+
+    def handle(self, *args, workers, **options):
+        shape = Shape(**{
+            name: options[name] for name in Shape.__dataclass_fields__})
+        started = time.monotonic()
+
+        def progress(kind, done):
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{kind}: {done} за {elapsed:.1f} с')
+
+        seed(shape, workers, progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.monotonic() - started:.1f} с'))
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import replicas
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файлы реплик '
+            '(DATABASE_REPLICAS)')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Реплики не настроены, см. YATUBE_REPLICAS')
+        for alias in settings.DATABASE_REPLICAS:
+            replicas.copy_database(settings.DATABASES[alias]['NAME'])
+            self.stdout.write(f'{alias}: обновлена')
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:02
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+# Копия posts.models.EXCERPT_LENGTH на момент миграции
+EXCERPT_LENGTH = 300
+
+
+def fill_excerpts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    last_pk = 0
+    while True:
+        posts = list(Post.objects.filter(pk__gt=last_pk).only(
+            'text').order_by('pk')[:500])
+        if not posts:
+            return
+        for post in posts:
+            post.excerpt = Truncator(post.text).chars(
+                EXCERPT_LENGTH, truncate='…')
+        Post.objects.bulk_update(posts, ['excerpt'])
+        last_pk = posts[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_comment_page_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=300, verbose_name='Отрывок'),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
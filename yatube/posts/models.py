@@ -1,8 +1,23 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils.text import Truncator
 
 User = get_user_model()
 
+# Длина отрывка поста в лентах, вместе с многоточием
+EXCERPT_LENGTH = 300
+EXCERPT_MARKER = '…'
+# Поля, которые выводят ленты; остальные колонки не читаются
+LISTING_FIELDS = (
+    'pub_date', 'updated_at', 'excerpt', 'image',
+    'author__username', 'author__first_name', 'author__last_name',
+    'group__slug',
+)
+
+
+def make_excerpt(text):
+    return Truncator(text).chars(EXCERPT_LENGTH, truncate=EXCERPT_MARKER)
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
@@ -13,9 +28,23 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Посты для лент: автор и группа одним JOIN, только нужные поля."""
+        return self.select_related('author', 'group').only(*LISTING_FIELDS)
+
+
 class Post(models.Model):
     text = models.TextField('Текст поста')
+    excerpt = models.CharField(
+        'Отрывок',
+        max_length=EXCERPT_LENGTH,
+        blank=True,
+        editable=False,
+    )
     pub_date = models.DateTimeField(auto_now_add=True)
+    # Входит в ключ закэшированной карточки поста (posts.cards)
+    updated_at = models.DateTimeField('Изменен', auto_now=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -37,15 +66,54 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False,
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         # выводим текст поста
         return self.text[:15]
 
+    @property
+    def is_excerpt_truncated(self):
+        return self.excerpt.endswith(EXCERPT_MARKER)
+
+    def save(self, *args, **kwargs):
+        # Отрывок хранится рядом с текстом, чтобы ленты не читали text
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'text' in update_fields:
+            self.excerpt = make_excerpt(self.text)
+            if update_fields is not None:
+                update_fields = {*update_fields, 'excerpt'}
+        if update_fields:
+            # Иначе auto_now не попадет в UPDATE и карточка не сменится
+            kwargs['update_fields'] = {*update_fields, 'updated_at'}
+        super().save(*args, **kwargs)
+
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Индексы повторяют сортировку лент: выборка страницы идет
+        # по диапазону индекса без сортировки во временном B-дереве
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx',
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -78,6 +146,13 @@ class Comment(models.Model):
     class Meta:
         ordering = [
             '-created',
+            '-id',
+        ]
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_idx',
+            ),
         ]
 
     def __str__(self):
@@ -101,9 +176,70 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx',
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'],
                 name='unique_following'
             )
         ]
+
+
+class UserStats(models.Model):
+    """Счетчики пользователя, которые поддерживаются при записи."""
+    user = models.OneToOneField(
+        User,
+        related_name='stats',
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+    )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Число подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self):
+        return str(self.user)
+
+
+class TimelineEntry(models.Model):
+    """Материализованная лента подписок: пост автора у подписчика."""
+    user = models.ForeignKey(
+        User,
+        related_name='timeline',
+        verbose_name='Читатель',
+        on_delete=models.CASCADE,
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+        on_delete=models.CASCADE,
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry'
+            )
+        ]
@@ -0,0 +1,295 @@
+import base64
+import json
+import math
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import (AutoField, DateTimeField, FloatField,
+                              IntegerField, Q)
+from django.http import QueryDict
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+class WindowedPage(Page):
+    @property
+    def elided_page_range(self):
+        return self.paginator.get_elided_page_range(self.number)
+
+
+class WindowedPaginator(Paginator):
+    """Paginator, который выводит не все номера страниц, а окно.
+
+    Первые и последние страницы, несколько вокруг текущей и многоточия
+    между ними (как get_elided_page_range из Django 3.2): размер
+    разметки не зависит от числа страниц.
+    """
+    ELLIPSIS = '…'
+
+    def _get_page(self, *args, **kwargs):
+        return WindowedPage(*args, **kwargs)
+
+    def get_elided_page_range(self, number=1, on_each_side=3, on_ends=2):
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > 1 + on_each_side + on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < self.num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(self.num_pages - on_ends + 1, self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+
+class ApproximatePaginator(WindowedPaginator):
+    """Число объектов берется из счетчика вместо COUNT(*).
+
+    approximate_count - функция, возвращающая значение счетчика; она
+    вызывается один раз и только если понадобилось число страниц.
+    Небольшие выборки (до EXACT_COUNT_LIMIT) считаются точно. Если
+    счетчик завышен, последняя страница может оказаться пустой.
+    """
+
+    def __init__(self, object_list, per_page, approximate_count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.approximate_count = approximate_count
+
+    @cached_property
+    def count(self):
+        count = self.approximate_count()
+        if count <= settings.EXACT_COUNT_LIMIT:
+            return self.object_list.count()
+        return count
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(values):
+    """Упаковывает значения ключа сортировки в непрозрачный токен."""
+    raw = json.dumps(
+        [value.isoformat() if hasattr(value, 'isoformat') else value
+         for value in values],
+        separators=(',', ':'),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+# Пределы INTEGER в SQLite
+MAX_INTEGER = 2 ** 63
+
+
+def cursor_kind(field):
+    """Тип значения поля модели в токене: 'datetime', 'int' или 'float'."""
+    if isinstance(field, DateTimeField):
+        return 'datetime'
+    if isinstance(field, (AutoField, IntegerField)):
+        return 'int'
+    if isinstance(field, FloatField):
+        return 'float'
+    raise ValueError(f'Поле {field.name} не годится для курсора')
+
+
+def _decode_value(value, kind):
+    if kind == 'datetime':
+        if not isinstance(value, str):
+            return None
+        try:
+            return parse_datetime(value)
+        except ValueError:
+            return None
+    # bool - подкласс int, но в ключе сортировки его не бывает
+    if isinstance(value, bool):
+        return None
+    if kind == 'int':
+        if isinstance(value, int) and -MAX_INTEGER <= value < MAX_INTEGER:
+            return value
+        return None
+    if isinstance(value, (int, float)) and math.isfinite(value):
+        return value
+    return None
+
+
+def decode_cursor(token, kinds):
+    """Распаковывает токен в значения полей сортировки.
+
+    kinds - типы значений по полям (cursor_kind); значение не того
+    типа делает токен битым, а не доходит до запроса.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor(token)
+    if not isinstance(values, list) or len(values) != len(kinds):
+        raise InvalidCursor(token)
+    decoded = []
+    for kind, value in zip(kinds, values):
+        value = _decode_value(value, kind)
+        if value is None:
+            raise InvalidCursor(token)
+        decoded.append(value)
+    return decoded
+
+
+class CursorPage(Sequence):
+    """Страница курсорной пагинации.
+
+    Повторяет ту часть интерфейса django.core.paginator.Page,
+    которой пользуются шаблоны, но без номеров страниц и COUNT(*).
+    """
+    template_name = 'includes/cursor_paginator.html'
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.params = QueryDict()
+
+    def __repr__(self):
+        return '<Cursor page of %s objects>' % len(self)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    # Пустая страница бывает по устаревшей ссылке "Следующая" после
+    # удалений: курсора у нее нет, назад ведет первая страница
+    @property
+    def next_cursor(self):
+        if self.has_next() and self.object_list:
+            return self.paginator.cursor_for(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous() and self.object_list:
+            return self.paginator.cursor_for(self.object_list[0])
+        return None
+
+    def _query(self, **cursor):
+        # Остальные параметры запроса (например, ?q= поиска) сохраняем
+        params = self.params.copy()
+        for key in ('after', 'before'):
+            params.pop(key, None)
+        params.update(
+            {key: value for key, value in cursor.items() if value is not None})
+        return params.urlencode()
+
+    @property
+    def first_query(self):
+        return self._query()
+
+    @property
+    def next_query(self):
+        return self._query(after=self.next_cursor)
+
+    @property
+    def previous_query(self):
+        return self._query(before=self.previous_cursor)
+
+
+class CursorPaginator:
+    """Keyset-пагинация по полям сортировки.
+
+    По умолчанию берется сортировка queryset, а если она не задана -
+    Meta.ordering модели, для постов (-pub_date, -id). Вместо OFFSET
+    страница выбирается условием по ключу последней (или первой) записи
+    соседней страницы, поэтому стоимость запроса не зависит от глубины
+    листания.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(
+            ordering or queryset.query.order_by
+            or queryset.model._meta.ordering
+        )
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.kinds = [cursor_kind(self._field(field)) for field in self.fields]
+
+    def _field(self, name):
+        # Поле сортировки бывает аннотацией (лента подписок) или pk
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            field = annotation.output_field
+        elif name == 'pk':
+            field = self.queryset.model._meta.pk
+        else:
+            field = self.queryset.model._meta.get_field(name)
+        return getattr(field, 'target_field', field)
+
+    def cursor_for(self, obj):
+        return encode_cursor(getattr(obj, field) for field in self.fields)
+
+    def _seek(self, values, forward):
+        # (a, b) < (x, y)  ->  a < x OR (a = x AND b < y)
+        condition = Q()
+        for position, field in enumerate(self.fields):
+            descending = self.ordering[position].startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            step = Q(**{f'{field}__{lookup}': values[position]})
+            for previous, value in zip(self.fields[:position], values):
+                step &= Q(**{previous: value})
+            condition |= step
+        return condition
+
+    def _reversed_ordering(self):
+        return [
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        ]
+
+    def page(self, after=None, before=None):
+        queryset = self.queryset
+        if before is not None:
+            values = decode_cursor(before, self.kinds)
+            rows = list(
+                queryset.filter(self._seek(values, forward=False))
+                .order_by(*self._reversed_ordering())[:self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            rows.reverse()
+            return CursorPage(rows, self, True, has_previous)
+        if after is not None:
+            values = decode_cursor(after, self.kinds)
+            queryset = queryset.filter(self._seek(values, forward=True))
+        rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return CursorPage(
+            rows[:self.per_page], self, has_next, after is not None
+        )
+
+    def get_page(self, params):
+        """Как Paginator.get_page: битый токен ведет на первую страницу."""
+        try:
+            page = self.page(
+                after=params.get('after'), before=params.get('before')
+            )
+        except InvalidCursor:
+            page = self.page()
+        page.params = params
+        return page
@@ -0,0 +1,146 @@
+"""Учет SQL-запросов на запрос к сайту и поиск N+1.
+
+QueryCountMiddleware записывает все запросы, выполненные за время
+обработки, вместе с местом вызова: строкой шаблона или строкой кода
+проекта. Запросы одной формы (тот же SQL с другими параметрами),
+повторенные больше QUERY_REPEAT_LIMIT раз, и превышение бюджета,
+объявленного на маршруте через query_budget, пишутся в лог. При
+QUERY_BUDGET_STRICT превышение бюджета - ошибка (так идут тесты).
+"""
+import logging
+import os
+import re
+import sys
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# IN (%s, %s, ...) разной длины - одна и та же форма запроса
+PARAMS_LIST_RE = re.compile(r'\(%s(?:, %s)+\)')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    """Объявляет для view максимум запросов на один вызов.
+
+    Декоратор не оборачивает view, а только помечает его, поэтому
+    бюджет можно навесить прямо в urls.py.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def query_shape(sql):
+    return PARAMS_LIST_RE.sub('(%s...)', sql)
+
+
+def _template_location(frame):
+    # Node.render_annotated - рендер одного узла шаблона, берем самый
+    # вложенный, то есть ближайший к запросу
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            origin = getattr(node, 'origin', None)
+            if token is not None and origin is not None:
+                return f'{origin.template_name}:{token.lineno}'
+        frame = frame.f_back
+    return None
+
+
+def _code_location(frame):
+    here = os.path.abspath(__file__)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if (filename.startswith(settings.BASE_DIR) and filename != here
+                and 'site-packages' not in filename):
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            return f'{path}:{frame.f_lineno}'
+        frame = frame.f_back
+    return None
+
+
+def call_location():
+    frame = sys._getframe(1)
+    return (
+        _template_location(frame) or _code_location(frame) or '<unknown>'
+    )
+
+
+class QueryReport:
+    """Запросы, выполненные при обработке одного HTTP-запроса."""
+
+    def __init__(self):
+        self.queries = []
+        self.budget = None
+        self.view_name = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((query_shape(sql), call_location()))
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and len(self) > self.budget
+
+    def repeated(self, limit=None):
+        """Формы запросов, выполненные больше limit раз, и места вызова."""
+        if limit is None:
+            limit = settings.QUERY_REPEAT_LIMIT
+        counts = Counter(shape for shape, location in self.queries)
+        locations = defaultdict(set)
+        for shape, location in self.queries:
+            if counts[shape] > limit:
+                locations[shape].add(location)
+        return {
+            shape: (counts[shape], sorted(places))
+            for shape, places in locations.items()
+        }
+
+
+class QueryCountMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_COUNT_ENABLED:
+            return self.get_response(request)
+        report = request.query_report = QueryReport()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(report))
+            response = self.get_response(request)
+        self.log(request, report)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        report = getattr(request, 'query_report', None)
+        if report is not None:
+            report.budget = getattr(view_func, 'query_budget', None)
+            report.view_name = request.resolver_match.view_name
+
+    def log(self, request, report):
+        view = report.view_name or request.path
+        if report.over_budget:
+            message = '%s: %d queries, budget is %d' % (
+                view, len(report), report.budget)
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        for shape, (count, locations) in report.repeated().items():
+            logger.warning(
+                '%s: possible N+1, query repeated %d times at %s: %s',
+                view, count, ', '.join(locations), shape,
+            )
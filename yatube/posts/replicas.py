@@ -0,0 +1,105 @@
+"""Чтение с реплик базы и запись в основную.
+
+Запросы на чтение идут на реплику (случайную из DATABASE_REPLICAS)
+только внутри view, помеченных read_replica, - это ленты и страница
+поста. Все остальное, в том числе чтение в view, которые пишут,
+идет в default. После записи ReplicaMiddleware ставит cookie, и
+REPLICA_PIN_SECONDS клиент читает только из default, чтобы сразу
+увидеть свой пост или комментарий, даже если реплика отстает.
+Страницы, которые кладутся в общий кэш (posts.cache), рендерятся из
+default: копию с отстающей реплики получили бы и закрепленные клиенты.
+
+Поэтому реплики разгружают default меньше, чем кажется по списку
+view: index, group_posts и profile при промахе кэша читают default,
+post_detail берет пост из кэша поста (posts.bundles), который тоже
+собирается из default. С реплик читают только follow_index,
+post_comments и следующие порции комментариев на post_detail -
+страницы, которые в общий кэш не кладутся. Остальные view нагружают
+default не чаще промахов кэша.
+"""
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'primary_pin'
+
+_local = threading.local()
+
+
+def replica_alias():
+    """Реплика для чтения или None, если читать нужно из default."""
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas or not getattr(_local, 'replica', False):
+        return None
+    return random.choice(replicas)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return replica_alias() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _local.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии default, объекты из них можно связывать
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def read_replica(view):
+    """Разрешает view читать с реплики, если клиент не закреплен."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        _local.replica = PIN_COOKIE not in request.COOKIES
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _local.replica = False
+    return wrapper
+
+
+@contextmanager
+def primary():
+    """Чтение только из default внутри блока, даже в read_replica."""
+    replica = getattr(_local, 'replica', False)
+    _local.replica = False
+    try:
+        yield
+    finally:
+        _local.replica = replica
+
+
+class ReplicaMiddleware:
+    """Закрепляет клиента за default на время после его записи."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.wrote = False
+        response = self.get_response(request)
+        if _local.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax')
+        return response
+
+
+def copy_database(path):
+    """Копирует default в файл SQLite через backup API."""
+    source = connections[DEFAULT_DB_ALIAS]
+    source.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        source.connection.backup(target)
+    finally:
+        target.close()
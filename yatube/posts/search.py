@@ -0,0 +1,147 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+posts_post_fts - FTS5-таблица с внешним содержимым (content='posts_post'):
+индекс хранит только словарь, тексты читаются из posts_post. Индекс
+обновляется из сигналов Post, выдача ранжируется по bm25 и листается
+курсором по (rank, id).
+"""
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+from .pagination import (CursorPage, CursorPaginator, decode_cursor,
+                         encode_cursor)
+
+FTS_TABLE = 'posts_post_fts'
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Превращает ввод пользователя в безопасное выражение MATCH."""
+    return ' '.join(f'"{term}"' for term in TERM_RE.findall(query))
+
+
+def index_post(post_id, text, old_text=None):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        if old_text is not None:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+                f"VALUES ('delete', %s, %s)", [post_id, old_text])
+        if text is not None:
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE}(rowid, text) VALUES (%s, %s)',
+                [post_id, text])
+
+
+def index_posts(post_ids):
+    """Добавляет в индекс пачку новых постов одним INSERT ... SELECT."""
+    if not is_supported() or not post_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, text) '
+            f'SELECT id, text FROM posts_post WHERE id IN ({placeholders})',
+            list(post_ids))
+
+
+def rebuild():
+    """Перестраивает индекс по posts_post целиком."""
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+class RawIdSubquery(RawSQL):
+    # RawSQL отдает SQL в скобках, а pk__in добавляет свои, и выходило
+    # IN ((SELECT ...)). Здесь SQL отдается без скобок: IN (SELECT ...)
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def matching_ids(query):
+    """Подзапрос id постов, подходящих под запрос, для .filter(pk__in=)."""
+    return RawIdSubquery(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [match_expression(query)],
+    )
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорная пагинация выдачи поиска по (rank, id)."""
+
+    fields = ('rank', 'id')
+    kinds = ('float', 'int')
+
+    def __init__(self, query, per_page, group_id=None, author_id=None):
+        self.match = match_expression(query)
+        self.per_page = int(per_page)
+        self.group_id = group_id
+        self.author_id = author_id
+
+    def cursor_for(self, post):
+        return encode_cursor([post.search_rank, post.id])
+
+    def _rows(self, cursor_values, forward):
+        where = [f'{FTS_TABLE} MATCH %s']
+        params = [self.match]
+        if self.group_id is not None:
+            where.append('p.group_id = %s')
+            params.append(self.group_id)
+        if self.author_id is not None:
+            where.append('p.author_id = %s')
+            params.append(self.author_id)
+        if cursor_values is not None:
+            sign = '>' if forward else '<'
+            where.append(
+                f'(f.rank {sign} %s OR (f.rank = %s AND f.rowid {sign} %s))')
+            rank, post_id = cursor_values
+            params.extend([rank, rank, post_id])
+        direction = '' if forward else ' DESC'
+        params.append(self.per_page + 1)
+        sql = (
+            f'SELECT f.rowid, f.rank FROM {FTS_TABLE} AS f '
+            f'JOIN posts_post AS p ON p.id = f.rowid '
+            f'WHERE {" AND ".join(where)} '
+            f'ORDER BY f.rank{direction}, f.rowid{direction} LIMIT %s'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _posts(self, rows):
+        posts = Post.objects.for_listing().in_bulk(
+            [post_id for post_id, rank in rows])
+        result = []
+        for post_id, rank in rows:
+            post = posts[post_id]
+            post.search_rank = rank
+            result.append(post)
+        return result
+
+    def page(self, after=None, before=None):
+        if not self.match:
+            return CursorPage([], self, False, False)
+        if before is not None:
+            rows = self._rows(decode_cursor(before, self.kinds), False)
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return CursorPage(self._posts(rows), self, True, has_previous)
+        cursor_values = None
+        if after is not None:
+            cursor_values = decode_cursor(after, self.kinds)
+        rows = self._rows(cursor_values, True)
+        return CursorPage(
+            self._posts(rows[:self.per_page]), self,
+            len(rows) > self.per_page, after is not None,
+        )
@@ -0,0 +1,294 @@
+"""Синтетические данные в форме продовой базы.
+
+Активность распределена по степенному закону (Ципф): немногие авторы
+пишут большую часть постов и собирают большую часть подписчиков,
+немногие группы и посты получают большую часть постов и комментариев.
+Длина текстов - логнормальная. Строки генерируются в пуле процессов,
+а пишутся в родителе через импортеры (posts.importer), которые
+поддерживают счетчики, ленты и поисковый индекс.
+"""
+import math
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from itertools import accumulate
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from faker import Faker
+
+from . import counters
+from .importer import IMPORTERS, chunked
+from .models import Group, Post, User
+
+CHUNK_SIZE = 5000
+SENTENCES = 2000
+IMAGE_VARIANTS = 12
+# Доля постов без группы
+NO_GROUP = 0.3
+# Медиана и разброс числа слов в тексте, логнормальное распределение
+POST_WORDS = (40, 1.0)
+COMMENT_WORDS = (12, 0.8)
+
+
+@dataclass
+class Shape:
+    """Размер и форма набора данных."""
+
+    users: int = 1000
+    groups: int = 20
+    posts: int = 20000
+    comments: int = 50000
+    follows: int = 10000
+    alpha: float = 1.1
+    images: float = 0.0
+    days: int = 365
+    seed: int = 0
+    password: str = None
+
+
+def zipf_cum_weights(size, alpha):
+    """Накопленные веса рангов 1..size: вес ранга r равен 1 / r**alpha."""
+    return list(accumulate(1 / rank ** alpha for rank in range(1, size + 1)))
+
+
+def scatter(size):
+    """Множитель, разбрасывающий популярные ранги по всему диапазону id."""
+    step = 7919
+    while math.gcd(step, size) != 1:
+        step += 1
+    return step
+
+
+def make_text(rng, sentences, words):
+    median, sigma = words
+    target = max(1, int(rng.lognormvariate(math.log(median), sigma)))
+    parts = []
+    count = 0
+    while count < target:
+        sentence = rng.choice(sentences)
+        parts.append(sentence)
+        count += sentence.count(' ') + 1
+    return ' '.join(parts)
+
+
+# Состояние процесса-генератора, заполняется в _init_worker
+_worker = {}
+
+
+def _init_worker(*args):
+    django.setup()
+    # Генераторы не ходят в базу, а соединения родителя им не годятся
+    connections.close_all()
+    _init_generator(*args)
+
+
+def _init_generator(shape, usernames, slugs):
+    shape = Shape(**shape)
+    faker = Faker('ru_RU')
+    faker.seed_instance(shape.seed)
+    # Самые пишущие и самые читаемые - не обязательно одни и те же люди:
+    # у каждой роли своя перестановка рангов
+    authors = list(usernames)
+    random.Random(f'{shape.seed}:authors').shuffle(authors)
+    celebrities = list(usernames)
+    random.Random(f'{shape.seed}:celebrities').shuffle(celebrities)
+    _worker.update(
+        shape=shape,
+        usernames=usernames,
+        authors=authors,
+        celebrities=celebrities,
+        slugs=slugs,
+        user_weights=zipf_cum_weights(len(usernames), shape.alpha),
+        group_weights=zipf_cum_weights(max(len(slugs), 1), shape.alpha),
+        sentences=[faker.sentence() for number in range(SENTENCES)],
+        now=timezone.now(),
+    )
+
+
+def _pick_users(rng, size, role='authors'):
+    return rng.choices(
+        _worker[role], cum_weights=_worker['user_weights'], k=size)
+
+
+def _date(rng):
+    seconds = rng.uniform(0, _worker['shape'].days * 24 * 60 * 60)
+    return (_worker['now'] - timedelta(seconds=seconds)).isoformat()
+
+
+def _post_rows(rng, size):
+    shape = _worker['shape']
+    slugs = _worker['slugs']
+    authors = _pick_users(rng, size)
+    rows = []
+    for author in authors:
+        group = None
+        if slugs and rng.random() >= NO_GROUP:
+            group = rng.choices(
+                slugs, cum_weights=_worker['group_weights'])[0]
+        row = {
+            'author': author,
+            'group': group,
+            'text': make_text(rng, _worker['sentences'], POST_WORDS),
+            'pub_date': _date(rng),
+        }
+        if rng.random() < shape.images:
+            row['image'] = image_name(rng.randrange(IMAGE_VARIANTS))
+        rows.append(row)
+    return rows
+
+
+def _comment_rows(rng, size, first_post, last_post):
+    count = last_post - first_post + 1
+    if _worker.get('post_count') != count:
+        _worker.update(post_count=count, post_weights=zipf_cum_weights(
+            count, _worker['shape'].alpha))
+    ranks = rng.choices(
+        range(count), cum_weights=_worker['post_weights'], k=size)
+    step = scatter(count)
+    return [
+        {'post': first_post + rank * step % count,
+         'author': author,
+         'text': make_text(rng, _worker['sentences'], COMMENT_WORDS),
+         'created': _date(rng)}
+        for rank, author in zip(ranks, _pick_users(rng, size))
+    ]
+
+
+def _follow_rows(rng, size):
+    # Подписываются все одинаково, а подписчиков набирают популярные
+    return [
+        {'user': rng.choice(_worker['usernames']), 'author': author}
+        for author in _pick_users(rng, size, 'celebrities')
+    ]
+
+
+def generate(kind, number, size, *args):
+    """Пачка строк для импортера; каждая пачка со своим зерном."""
+    rng = random.Random(f'{_worker["shape"].seed}:{kind}:{number}')
+    if kind == 'posts':
+        return _post_rows(rng, size)
+    if kind == 'comments':
+        return _comment_rows(rng, size, *args)
+    return _follow_rows(rng, size)
+
+
+def image_name(variant):
+    return f'posts/seed/{variant}.png'
+
+
+def create_images():
+    """Несколько картинок разного размера, на них ссылаются посты."""
+    from PIL import Image
+    directory = os.path.join(settings.MEDIA_ROOT, 'posts', 'seed')
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(0)
+    for variant in range(IMAGE_VARIANTS):
+        size = (rng.randint(320, 1920), rng.randint(240, 1080))
+        color = tuple(rng.randrange(256) for channel in range(3))
+        Image.new('RGB', size, color).save(
+            os.path.join(settings.MEDIA_ROOT, image_name(variant)))
+
+
+def create_users(shape):
+    faker = Faker('ru_RU')
+    faker.seed_instance(shape.seed)
+    password = make_password(shape.password)
+    usernames = []
+    for numbers in chunked(range(shape.users), CHUNK_SIZE):
+        users = [
+            User(username=f'{faker.user_name()}_{number}',
+                 first_name=faker.first_name(), last_name=faker.last_name(),
+                 password=password)
+            for number in numbers
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            # bulk_create не вызывает сигналы, строки счетчиков - здесь
+            ids = User.objects.filter(username__in=[
+                user.username for user in users
+            ]).values_list('pk', flat=True)
+            counters.rebuild_user_stats(list(ids))
+        usernames.extend(user.username for user in users)
+    return usernames
+
+
+def create_groups(shape):
+    faker = Faker('ru_RU')
+    faker.seed_instance(shape.seed)
+    groups = [
+        Group(title=faker.catch_phrase()[:200], slug=f'group-{number}',
+              description=faker.paragraph())
+        for number in range(shape.groups)
+    ]
+    Group.objects.bulk_create(groups)
+    return [group.slug for group in groups]
+
+
+def _tasks(kind, total, *args):
+    for number, start in enumerate(range(0, total, CHUNK_SIZE)):
+        yield (kind, number, min(CHUNK_SIZE, total - start)) + args
+
+
+def _write(kind, chunks, progress):
+    importer = IMPORTERS[kind](batch_size=1000)
+    for rows in chunks:
+        importer.import_chunk(rows)
+        progress(kind, importer.created)
+
+
+def _generate(pool, tasks, ahead):
+    """Пачки по порядку, генерация опережает запись не больше чем на ahead.
+
+    Без ограничения Executor.map сгенерировал бы все пачки сразу, и
+    они копились бы в памяти, пока родитель пишет в базу.
+    """
+    if pool is None:
+        yield from (generate(*task) for task in tasks)
+        return
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(generate, *task))
+        if len(pending) >= ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def seed(shape, workers=None, progress=lambda kind, done: None):
+    """Заполняет базу; workers=0 - генерация в текущем процессе."""
+    if shape.images:
+        create_images()
+    usernames = create_users(shape)
+    progress('users', len(usernames))
+    slugs = create_groups(shape)
+    initargs = (asdict(shape), usernames, slugs)
+    if workers == 0:
+        _init_generator(*initargs)
+        _fill(None, 1, shape, progress)
+        return
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=initargs) as pool:
+        _fill(pool, 2 * workers, shape, progress)
+
+
+def _fill(pool, ahead, shape, progress):
+    def write(kind, total, *args):
+        chunks = _generate(pool, _tasks(kind, total, *args), ahead)
+        _write(kind, chunks, progress)
+
+    # Подписки раньше постов: к раздаче постов уже известно, кто из
+    # авторов набрал больше TIMELINE_FANOUT_LIMIT подписчиков
+    write('follows', shape.follows)
+    write('posts', shape.posts)
+    ids = Post.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if ids['first'] is not None:
+        write('comments', shape.comments, ids['first'], ids['last'])
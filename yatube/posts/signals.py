@@ -0,0 +1,167 @@
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import bundles, cache, cards, counters, search, thumbnails, timeline
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def _post_scopes(slug, username):
+    scopes = ['index', f'profile:{username}']
+    if slug is not None:
+        scopes.append(f'group:{slug}')
+    return scopes
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_delete, sender=Post)
+def remember_post_state(sender, instance, raw=False, **kwargs):
+    # Запоминаем состояние до записи: при смене группы устаревают обе
+    # области, при смене картинки - миниатюры старой
+    if raw:
+        return
+    scopes = _post_scopes(
+        instance.group.slug if instance.group_id else None,
+        instance.author.username,
+    )
+    old_image = old_text = None
+    old_group_id = instance.group_id
+    if instance.pk is not None:
+        old = Post.objects.filter(pk=instance.pk).values_list(
+            'group__slug', 'author__username', 'image', 'text',
+            'group_id').first()
+        if old is not None:
+            scopes.extend(_post_scopes(*old[:2]))
+            old_image, old_text, old_group_id = old[2:]
+    instance._cache_scopes = scopes
+    instance._old_image = old_image
+    instance._old_text = old_text
+    instance._old_group_id = old_group_id
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deleted = kwargs['signal'] is post_delete
+    scopes = getattr(instance, '_cache_scopes', ['index'])
+    post_id = instance.pk
+    transaction.on_commit(lambda: cache.bump(*scopes))
+    transaction.on_commit(lambda: bundles.forget(post_id))
+    old_image = getattr(instance, '_old_image', None)
+    if old_image and (deleted or old_image != instance.image.name):
+        thumbnails.forget(old_image)
+    old_text = getattr(instance, '_old_text', None)
+    if deleted:
+        search.index_post(instance.pk, None, old_text=old_text)
+    elif old_text != instance.text:
+        search.index_post(instance.pk, instance.text, old_text=old_text)
+
+
+@receiver(pre_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    scopes = ['index', f'group:{instance.slug}']
+    if instance.pk is not None:
+        old_slug = Group.objects.filter(pk=instance.pk).values_list(
+            'slug', flat=True).first()
+        scopes.extend(
+            [f'group:{old_slug}', cards.GROUP_SCOPE.format(instance.pk)])
+    transaction.on_commit(lambda: cache.bump(*scopes))
+
+
+@receiver(pre_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_pages(sender, instance, raw=False, update_fields=None,
+                          **kwargs):
+    # Вход пользователя обновляет только last_login, страницы не меняются
+    if raw or update_fields == frozenset(['last_login']):
+        return
+    scopes = ['index', 'users', f'profile:{instance.username}']
+    if instance.pk is not None:
+        old_username = User.objects.filter(pk=instance.pk).values_list(
+            'username', flat=True).first()
+        scopes.extend([f'profile:{old_username}',
+                       cards.AUTHOR_SCOPE.format(instance.pk)])
+    transaction.on_commit(lambda: cache.bump(*scopes))
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.change_user_stats(instance.author_id, 'posts_count', 1)
+        scope = bundles.AUTHOR_POSTS_SCOPE.format(instance.author_id)
+        transaction.on_commit(lambda: cache.bump(scope))
+        counters.change_listing_count('all', 1)
+        if instance.group_id is not None:
+            counters.change_listing_count(
+                counters.group_scope(instance.group_id), 1)
+        timeline.fan_out(instance)
+        return
+    old_group_id = getattr(instance, '_old_group_id', instance.group_id)
+    if old_group_id != instance.group_id:
+        for group_id, delta in ((old_group_id, -1), (instance.group_id, 1)):
+            if group_id is not None:
+                counters.change_listing_count(
+                    counters.group_scope(group_id), delta)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.change_user_stats(instance.author_id, 'posts_count', -1)
+    scope = bundles.AUTHOR_POSTS_SCOPE.format(instance.author_id)
+    transaction.on_commit(lambda: cache.bump(scope))
+    counters.change_listing_count('all', -1)
+    if instance.group_id is not None:
+        counters.change_listing_count(
+            counters.group_scope(instance.group_id), -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_comments_count(instance.post_id, 1)
+        post_id = instance.post_id
+        transaction.on_commit(lambda: bundles.forget(post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_comments_count(instance.post_id, -1)
+    post_id = instance.post_id
+    transaction.on_commit(lambda: bundles.forget(post_id))
+
+
+def _bump_follow_pages(follow):
+    scopes = [f'profile:{follow.author.username}', f'follows:{follow.user_id}']
+    transaction.on_commit(lambda: cache.bump(*scopes))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _bump_follow_pages(instance)
+        counters.change_user_stats(instance.author_id, 'followers_count', 1)
+        counters.change_user_stats(instance.user_id, 'following_count', 1)
+        timeline.backfill(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    _bump_follow_pages(instance)
+    counters.change_user_stats(instance.author_id, 'followers_count', -1)
+    counters.change_user_stats(instance.user_id, 'following_count', -1)
+    timeline.remove(instance)
+    timeline.followers_dropped(instance.author_id)
@@ -0,0 +1,72 @@
+"""Счетчики событий кэшей, общие для всех процессов.
+
+Каждый процесс считает события у себя, а приращения добавляет к
+счетчикам в общем кэше не чаще раза в CACHE_STATS_FLUSH_INTERVAL
+секунд: incr на каждое событие был бы записью в кэш на каждом запросе.
+Общие счетчики показывает команда cache_stats.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+STATS_KEY = 'stats:{}:{}'
+
+
+class Stats:
+    def __init__(self, name, events):
+        self.name = name
+        self.events = events
+        self._counts = Counter()
+        self._unflushed = Counter()
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _key(self, event):
+        return STATS_KEY.format(self.name, event)
+
+    def count(self, event):
+        with self._lock:
+            self._counts[event] += 1
+            self._unflushed[event] += 1
+            due = (time.monotonic() - self._flushed_at
+                   >= settings.CACHE_STATS_FLUSH_INTERVAL)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Добавляет накопленные приращения к общим счетчикам."""
+        with self._lock:
+            unflushed = self._unflushed
+            self._unflushed = Counter()
+            self._flushed_at = time.monotonic()
+        for event, delta in unflushed.items():
+            key = self._key(event)
+            if cache.add(key, delta, None):
+                continue
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                # Счетчик сбросили между add и incr
+                cache.add(key, delta, None)
+
+    def local(self):
+        """События в этом процессе."""
+        with self._lock:
+            return {event: self._counts[event] for event in self.events}
+
+    def shared(self):
+        """События во всех процессах, кроме еще не сброшенных."""
+        found = cache.get_many([self._key(event) for event in self.events])
+        return {event: found.get(self._key(event), 0)
+                for event in self.events}
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self._unflushed.clear()
+
+    def reset_shared(self):
+        cache.delete_many([self._key(event) for event in self.events])
@@ -0,0 +1,16 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts.cards import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """Пары (пост, HTML карточки) для цикла по странице ленты:
+    {% post_cards page_obj as cards %}{% for post, card in cards %}.
+    """
+    posts = list(posts)
+    cards = render_cards(posts, context.get('request'))
+    return [(post, mark_safe(card)) for post, card in zip(posts, cards)]
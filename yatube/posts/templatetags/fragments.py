@@ -0,0 +1,15 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts import fragments
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def fragment(context, name, **params):
+    """Персональный фрагмент: маркер в общей странице или сам фрагмент."""
+    request = context.get('request')
+    if getattr(request, 'shared_render', False):
+        return mark_safe(fragments.marker(name, params))
+    return fragments.render_fragment(name, request, params)
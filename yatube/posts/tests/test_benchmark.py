@@ -0,0 +1,58 @@
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from posts import benchmark
+from posts.models import Comment, Post
+from posts.seeding import Shape, seed
+from yatube.wsgi import application
+
+
+class TestBenchmark(TestCase):
+    """Нагрузочный прогон на маленьком наборе данных."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        seed(Shape(users=5, groups=2, posts=30, comments=20, follows=10),
+             workers=0)
+        cls.sample = benchmark.Sample()
+        cls.wsgi_client = benchmark.Client(
+            application, benchmark.login_cookie(cls.sample.reader))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile([7], 95), 7)
+
+    def test_paginator_markup_does_not_grow_with_pages(self):
+        small = benchmark.render_paginator(20, repeats=1)
+        huge = benchmark.render_paginator(100000, repeats=1)
+        self.assertLess(huge['bytes'], small['bytes'] * 2)
+
+    def test_cache_workload_keeps_increments(self):
+        directory = tempfile.mkdtemp()
+        try:
+            result = benchmark.cache_workload(
+                'sqlite', directory, processes=2, operations=200, keys=20)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        self.assertEqual(result['counter'], result['increments'])
+        self.assertGreater(result['hit_rate'], 0.5)
+
+    def test_seed(self):
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), 20)
+
+    def test_run_routes(self):
+        """Все маршруты отвечают без ошибок, запросы к базе посчитаны."""
+        for route in benchmark.ROUTES:
+            with self.subTest(route=route):
+                result = benchmark.run_route(
+                    self.wsgi_client, route, self.sample, requests=3,
+                    concurrency=1)
+                self.assertEqual(result['errors'], 0)
+                self.assertGreater(result['queries_per_request'], 0)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
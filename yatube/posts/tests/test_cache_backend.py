@@ -0,0 +1,104 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+from core.cache import SQLiteCache
+
+
+def set_in_child(location):
+    SQLiteCache(location, {}).set('from-child', 'value')
+
+
+class TestSQLiteCache(SimpleTestCase):
+    """Общий кэш в файле SQLite."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_get_set_add_delete(self):
+        self.cache.set('key', {'value': [1, 2]})
+        self.assertEqual(self.cache.get('key'), {'value': [1, 2]})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', 'value'))
+        self.assertEqual(
+            self.cache.get_many(['key', 'new', 'missing']),
+            {'key': {'value': [1, 2]}, 'new': 'value'})
+        self.cache.delete_many(['key', 'new'])
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+        self.cache.set_many({'first': 1, 'second': 'two'})
+        self.assertEqual(self.cache.get_many(['first', 'second']),
+                         {'first': 1, 'second': 'two'})
+        self.assertEqual(self.cache.stats()['entries'], 2)
+
+    def test_expired_entries_are_invisible_and_replaceable(self):
+        self.cache.set('key', 'old', timeout=0.05)
+        time.sleep(0.1)
+        self.assertFalse(self.cache.has_key('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_incr_is_atomic(self):
+        self.cache.set('counter', 0)
+
+        def bump():
+            for number in range(200):
+                self.cache.incr('counter')
+
+        threads = [threading.Thread(target=bump) for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('counter'), 800)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_size_limits_cull_soonest_expiring(self):
+        cache = self.make_cache(MAX_ENTRIES=10, MAX_SIZE=5000)
+        for number in range(20):
+            cache.set(f'key{number}', 'x' * 100, timeout=100 + number)
+        self.assertLessEqual(cache.stats()['entries'], 10)
+        self.assertTrue(cache.has_key('key19'))
+        self.assertFalse(cache.has_key('key0'))
+        cache.set('big', 'x' * 6000)
+        self.assertLessEqual(cache.stats()['size'], 5000 + 6100)
+
+    def test_shared_between_processes(self):
+        process = multiprocessing.get_context('fork').Process(
+            target=set_in_child, args=(self.location,))
+        process.start()
+        process.join()
+        self.assertEqual(self.cache.get('from-child'), 'value')
+
+    def test_tests_do_not_touch_working_cache(self):
+        """Тесты работают с временным файлом кэша, а не с рабочим"""
+        self.assertNotEqual(
+            os.path.dirname(caches['default'].location), settings.BASE_DIR)
+
+    def test_old_sqlite_is_rejected(self):
+        """На SQLite без UPSERT кэш не создается"""
+        with mock.patch('sqlite3.sqlite_version_info', (3, 22, 0)):
+            with self.assertRaises(ImproperlyConfigured):
+                SQLiteCache(self.location, {})
+        with mock.patch('sqlite3.sqlite_version_info', (3, 31, 1)):
+            cache = SQLiteCache(self.location, {})
+        cache.set('counter', 1)
+        self.assertEqual(cache.incr('counter', 2), 3)
@@ -0,0 +1,84 @@
+import csv
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post, User
+
+
+class TestExport(TestCase):
+    """Потоковая выгрузка постов автора и группы."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Test title',
+            slug='test-slug',
+            description='Test description',
+        )
+        cls.first = Post.objects.create(
+            text='First', author=cls.author, group=cls.group,
+            image='posts/first.gif')
+        cls.second = Post.objects.create(text='Second', author=cls.author)
+        Post.objects.create(text='Other', author=cls.reader, group=cls.group)
+        for text in ('One', 'Two'):
+            Comment.objects.create(
+                post=cls.first, author=cls.reader, text=text)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_profile_export_jsonl(self):
+        """JSONL: пост, за ним его комментарии, ссылки абсолютные."""
+        response = self.client.get(
+            reverse('posts:profile_export', kwargs={'username': 'author'}))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            [(record['type'], record['text']) for record in records],
+            [('post', 'First'), ('comment', 'One'), ('comment', 'Two'),
+             ('post', 'Second')],
+        )
+        self.assertEqual(
+            records[0]['image'], 'http://testserver/media/posts/first.gif')
+        self.assertEqual(records[1]['post'], self.first.pk)
+        self.assertIsNone(records[3]['image'])
+
+    def test_group_export_csv(self):
+        """CSV с заголовком, в выгрузке только посты группы."""
+        response = self.client.get(
+            reverse('posts:group_export', kwargs={'slug': 'test-slug'}),
+            {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(
+            b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(
+            [row['text'] for row in rows if row['type'] == 'post'],
+            ['First', 'Other'],
+        )
+
+    def test_export_requires_login(self):
+        response = Client().get(
+            reverse('posts:profile_export', kwargs={'username': 'author'}))
+        self.assertEqual(response.status_code, 302)
+
+    def test_export_posts_command(self):
+        output = StringIO()
+        call_command(
+            'export_posts', '--author=author',
+            '--base-url=https://example.com', stdout=output)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(records), 4)
+        self.assertEqual(
+            records[0]['image'], 'https://example.com/media/posts/first.gif')
@@ -0,0 +1,147 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from posts import search
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry, User,
+                          UserStats)
+
+
+class TestImportContent(TestCase):
+    """Команда import_content: пачки, побочные данные и отметка."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Test title',
+            slug='test-slug',
+            description='Test description',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write_jsonl(self, name, rows):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as output:
+            for row in rows:
+                output.write(
+                    row if isinstance(row, str) else json.dumps(row))
+                output.write('\n')
+        return path
+
+    def write_csv(self, name, rows):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', newline='', encoding='utf-8') as output:
+            writer = csv.DictWriter(output, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def run_import(self, *args):
+        call_command(
+            'import_content', *args, '--batch-size=2', '--chunk-size=3',
+            stdout=StringIO(), stderr=StringIO())
+
+    def test_import_posts(self):
+        """Посты пишутся с датами из файла, счетчики и ленты обновлены."""
+        path = self.write_jsonl('posts.jsonl', [
+            {'text': 'Импорт один', 'author': 'author',
+             'group': 'test-slug', 'pub_date': '2020-01-02T03:04:05'},
+            {'text': 'Импорт два', 'author': 'author'},
+            {'text': 'Нет автора', 'author': 'nobody'},
+            'not json',
+            {'text': 'Импорт три', 'author': 'author', 'id': 500},
+        ])
+        self.run_import('posts', path)
+        posts = Post.objects.filter(author=self.author)
+        self.assertEqual(posts.count(), 3)
+        first = posts.get(text='Импорт один')
+        self.assertEqual(first.group, self.group)
+        self.assertEqual(first.pub_date.year, 2020)
+        self.assertEqual(first.excerpt, first.text)
+        self.assertTrue(posts.filter(pk=500).exists())
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 3)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 3)
+        self.assertEqual(
+            Post.objects.filter(pk__in=search.matching_ids('импорт')).count(),
+            3)
+        with open(f'{path}.checkpoint') as checkpoint:
+            self.assertEqual(checkpoint.read(), '5')
+
+    def test_taken_post_ids_are_skipped(self):
+        """Занятый id - пропущенная строка, а не сбой всего импорта."""
+        existing = Post.objects.create(
+            text='Уже есть', author=self.author, id=700)
+        path = self.write_jsonl('posts.jsonl', [
+            {'text': 'Занятый id', 'author': 'author', 'id': 700},
+            {'text': 'Новый id', 'author': 'author', 'id': 701},
+            {'text': 'Повтор в файле', 'author': 'author', 'id': 701},
+            {'text': 'Без id', 'author': 'author'},
+        ])
+        self.run_import('posts', path)
+        existing.refresh_from_db()
+        self.assertEqual(existing.text, 'Уже есть')
+        self.assertEqual(Post.objects.get(pk=701).text, 'Новый id')
+        self.assertEqual(
+            Post.objects.filter(author=self.author).count(), 3)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 3)
+
+    def test_import_resumes_from_checkpoint(self):
+        """Повторный запуск продолжает с отметки, а не с начала."""
+        path = self.write_jsonl('posts.jsonl', [
+            {'text': f'Post {number}', 'author': 'author'}
+            for number in range(5)
+        ])
+        with open(f'{path}.checkpoint', 'w') as checkpoint:
+            checkpoint.write('3')
+        self.run_import('posts', path)
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)
+                 .order_by('text')),
+            ['Post 3', 'Post 4'],
+        )
+        self.run_import('posts', path)
+        self.assertEqual(Post.objects.count(), 2)
+
+    def test_import_comments_and_follows(self):
+        """Комментарии и подписки из CSV, новые пользователи по флагу."""
+        post = Post.objects.create(author=self.author, text='Test post')
+        comments = self.write_csv('comments.csv', [
+            {'post': post.pk, 'author': 'reader', 'text': 'Comment'},
+            {'post': post.pk, 'author': 'newcomer', 'text': 'Comment'},
+            {'post': 'abc', 'author': 'reader', 'text': 'Comment'},
+        ])
+        self.run_import('comments', comments, '--create-users')
+        post.refresh_from_db()
+        self.assertEqual(Comment.objects.filter(post=post).count(), 2)
+        self.assertEqual(post.comments_count, 2)
+        newcomer = User.objects.get(username='newcomer')
+        self.assertFalse(newcomer.has_usable_password())
+        follows = self.write_jsonl('follows.jsonl', [
+            {'user': 'newcomer', 'author': 'author'},
+            {'user': 'reader', 'author': 'author'},
+            {'user': 'author', 'author': 'author'},
+        ])
+        self.run_import('follows', follows)
+        self.assertEqual(Follow.objects.filter(author=self.author).count(), 2)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 2)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=newcomer, post=post).exists())
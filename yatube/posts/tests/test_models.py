@@ -1,6 +1,13 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
 
-from posts.models import Group, Post, User
+from posts import counters
+from posts.models import (EXCERPT_LENGTH, Comment, Follow, Group, Post, User,
+                          UserStats)
 
 
 class TestPostModels(TestCase):
@@ -24,3 +31,123 @@ class TestPostModels(TestCase):
         post = self.post
         self.assertEqual(str(self.post), post.text[:15])
         self.assertEqual(str(self.group), group.title)
+
+    def test_excerpt_follows_text(self):
+        """Отрывок пересчитывается при сохранении текста."""
+        self.assertEqual(self.post.excerpt, self.post.text)
+        self.assertFalse(self.post.is_excerpt_truncated)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Слово ' * EXCERPT_LENGTH
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertEqual(len(post.excerpt), EXCERPT_LENGTH)
+        self.assertTrue(post.is_excerpt_truncated)
+        self.assertTrue(post.text.startswith(post.excerpt[:-1]))
+
+    def test_updated_at_changes_with_update_fields(self):
+        """updated_at сдвигается и при сохранении отдельных полей."""
+        post = Post.objects.get(pk=self.post.pk)
+        updated_at = post.updated_at
+        post.text = 'Новый текст'
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertGreater(post.updated_at, updated_at)
+
+
+class TestCounters(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_creates_and_deletes(self):
+        """Счетчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(author=self.author, text='Test post')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Test comment')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_listing_counts_follow_posts(self):
+        """Счетчики постов ленты и групп сдвигаются сигналами."""
+        cache.clear()
+        first = Group.objects.create(title='First', slug='first')
+        second = Group.objects.create(title='Second', slug='second')
+
+        def counts():
+            return [
+                counters.listing_count('all', Post.objects.all()),
+                counters.listing_count(
+                    counters.group_scope(first.pk), first.group_posts.all()),
+                counters.listing_count(
+                    counters.group_scope(second.pk),
+                    second.group_posts.all()),
+            ]
+
+        self.assertEqual(counts(), [0, 0, 0])
+        post = Post.objects.create(
+            author=self.author, group=first, text='Test post')
+        self.assertEqual(counts(), [1, 1, 0])
+        post.group = second
+        post.save()
+        self.assertEqual(counts(), [1, 0, 1])
+        post.delete()
+        self.assertEqual(counts(), [0, 0, 0])
+
+    def test_deleting_author_cascades_cleanly(self):
+        """Каскадное удаление автора не оставляет строк счетчиков."""
+        user = User.objects.create_user(username='leaving')
+        post = Post.objects.create(author=user, text='Test post')
+        Comment.objects.create(post=post, author=user, text='Comment')
+        Follow.objects.create(user=self.reader, author=user)
+        user.delete()
+        self.assertFalse(UserStats.objects.filter(user_id=user.pk).exists())
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_pages_rebuild_missing_stats(self):
+        """Профиль и пост автора без строки счетчиков открываются."""
+        cache.clear()
+        post = Post.objects.create(author=self.author, text='Test post')
+        UserStats.objects.filter(user=self.author).delete()
+        pages = (
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        )
+        for page in pages:
+            with self.subTest(page=page):
+                response = self.client.get(page)
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+
+    def test_recount_stats_repairs_counters(self):
+        """recount_stats восстанавливает разъехавшиеся счетчики."""
+        post = Post.objects.create(author=self.author, text='Test post')
+        Comment.objects.create(post=post, author=self.reader, text='Text')
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.update(
+            posts_count=7, followers_count=7, following_count=7)
+        UserStats.objects.filter(user=self.reader).delete()
+        Post.objects.update(comments_count=7)
+        call_command('recount_stats', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
@@ -0,0 +1,114 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import urls
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry, User,
+                          UserStats)
+from posts.querycount import QueryReport
+
+
+@override_settings(QUERY_COUNT_ENABLED=True)
+class TestQueryBudgets(TestCase):
+    """Маршруты posts укладываются в бюджет запросов и не делают N+1."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{number}')
+            for number in range(3)
+        ]
+        cls.groups = [
+            Group.objects.create(
+                title=f'Group {number}',
+                slug=f'group-{number}',
+                description='Test description',
+            )
+            for number in range(2)
+        ]
+        for number in range(15):
+            Post.objects.create(
+                text=f'Post {number}',
+                author=cls.authors[number % 3],
+                group=cls.groups[number % 2],
+            )
+        cls.post = Post.objects.filter(author=cls.authors[0]).first()
+        for author in cls.authors:
+            Comment.objects.create(
+                post=cls.post, author=author, text='Comment')
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.kwargs = {
+            'slug': cls.groups[0].slug,
+            'username': cls.authors[1].username,
+            'post_id': cls.post.pk,
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.authors[0])
+
+    def get_report(self, pattern):
+        kwargs = {
+            name: value for name, value in self.kwargs.items()
+            if f':{name}>' in str(pattern.pattern)
+        }
+        url = reverse(f'posts:{pattern.name}', kwargs=kwargs)
+        if pattern.name in ('post_create', 'post_edit', 'add_comment'):
+            response = self.client.post(
+                url, {'text': 'Text', 'group': self.groups[0].pk})
+        else:
+            response = self.client.get(url, {'q': 'post'})
+        return response.wsgi_request.query_report
+
+    def test_routes_declare_budgets(self):
+        for pattern in urls.urlpatterns:
+            with self.subTest(name=pattern.name):
+                self.assertIsInstance(
+                    getattr(pattern.callback, 'query_budget', None), int)
+
+    def test_routes_fit_budgets(self):
+        for pattern in urls.urlpatterns:
+            with self.subTest(name=pattern.name):
+                self.assertFitsBudget(self.get_report(pattern))
+
+    def assertFitsBudget(self, report):
+        self.assertLessEqual(len(report), report.budget)
+        self.assertEqual(report.repeated(), {})
+
+    def test_profile_rebuilding_stats_fits_budget(self):
+        """Профиль без строки счетчиков пересчитывает их в пределах бюджета."""
+        author = self.authors[1]
+        UserStats.objects.filter(user=author).delete()
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': author.username}))
+        self.assertFitsBudget(response.wsgi_request.query_report)
+        self.assertEqual(
+            UserStats.objects.get(user=author).posts_count, 5)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_unfollow_refilling_timelines_fits_budget(self):
+        """Отписка, после которой автор перестал быть крупным и ленты
+        дозаполняются, укладывается в бюджет."""
+        author = self.authors[1]
+        Follow.objects.create(user=self.authors[0], author=author)
+        TimelineEntry.objects.filter(user=self.reader).delete()
+        response = self.client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': author.username}))
+        self.assertFitsBudget(response.wsgi_request.query_report)
+        self.assertEqual(
+            TimelineEntry.objects.filter(
+                user=self.reader, post__author=author).count(), 5)
+
+    def test_repeated_queries_detected(self):
+        report = QueryReport()
+        with connection.execute_wrapper(report):
+            authors = [post.author for post in Post.objects.all()]
+        self.assertEqual(len(authors), 15)
+        ((count, locations),) = report.repeated().values()
+        self.assertEqual(count, 15)
+        self.assertEqual(len(locations), 1)
+        self.assertIn('test_query_budgets.py', locations[0])
@@ -0,0 +1,90 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.search import FTS_TABLE
+
+# Полный проход по таблице приложения или сортировка во временном B-дереве
+FULL_SCAN_RE = re.compile(r'^SCAN (TABLE )?posts_\w+( AS \w+)?$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+class TestQueryPlans(TestCase):
+    """Запросы лент читают страницу по индексу, без полного скана."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Test title',
+            slug='test-slug',
+            description='Test description',
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Post {number}', author=cls.author, group=cls.group)
+            for number in range(15))
+        cls.post = Post.objects.create(
+            text='Post', author=cls.author, group=cls.group)
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.reader, text='Comment')
+            for number in range(25))
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.urls = [
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.author}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': cls.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=post',
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_plans_use_indexes(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'posts_' not in sql:
+                continue
+            for step in self.explain(sql):
+                with self.subTest(url=url, sql=sql, step=step):
+                    self.assertIsNone(FULL_SCAN_RE.match(step))
+                    # Выдача поиска по bm25 сортируется только после MATCH
+                    if FTS_TABLE not in sql:
+                        self.assertNotIn(TEMP_SORT, step)
+
+    def test_listing_queries_use_indexes(self):
+        for url in self.urls:
+            self.assert_plans_use_indexes(url)
+
+    @override_settings(POSTS_PAGINATION='cursor')
+    def test_cursor_listing_queries_use_indexes(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            # Ленты листаются через page_obj, комментарии - через comments
+            for key in ('page_obj', 'comments'):
+                if key not in response.context:
+                    continue
+                page = response.context[key]
+                if page.has_next():
+                    cache.clear()
+                    self.assert_plans_use_indexes(
+                        url.split('?')[0] + '?' + page.next_query)
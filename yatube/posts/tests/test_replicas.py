@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.urls import reverse
+
+from posts import replicas
+from posts.models import Post, User
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class TestReplicas(TestCase):
+    """Чтение лент с реплик и закрепление клиента после записи."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='user')
+        cls.post = Post.objects.create(author=cls.user, text='Test post')
+        cls.router = replicas.ReplicaRouter()
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def read_alias(self, view, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        return view(request)
+
+    def test_reads_go_to_replica_only_in_marked_views(self):
+        def view(request):
+            return self.router.db_for_read(Post)
+
+        self.assertEqual(
+            self.read_alias(replicas.read_replica(view)), 'replica1')
+        self.assertEqual(self.read_alias(view), 'default')
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+
+    def test_pinned_client_reads_primary(self):
+        def view(request):
+            return self.router.db_for_read(Post)
+
+        self.assertEqual(self.read_alias(
+            replicas.read_replica(view), {replicas.PIN_COOKIE: '1'}),
+            'default')
+
+    def test_write_pins_client_to_primary(self):
+        """После записи клиент видит свой комментарий из default."""
+        response = self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Свежий комментарий'})
+        pin = response.cookies[replicas.PIN_COOKIE]
+        self.assertEqual(pin['max-age'], settings.REPLICA_PIN_SECONDS)
+        # Реплики replica1 в тестах нет: чтение с нее бы упало
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        self.assertContains(response, 'Свежий комментарий')
+
+    def test_shared_pages_render_from_primary(self):
+        """Общая копия ленты не берется с реплики: ее увидит и писавший."""
+        cache.clear()
+        # Реплики replica1 в тестах нет: чтение с нее бы упало
+        for url in (reverse('posts:index'),
+                    reverse('posts:profile', kwargs={'username': 'user'})):
+            with self.subTest(url=url):
+                response = Client().get(url)
+                self.assertContains(response, self.post.text)
+
+    def test_reads_do_not_pin(self):
+        self.client.cookies[replicas.PIN_COOKIE] = '1'
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+
+class TestCopyDatabase(TransactionTestCase):
+    """Локальная реплика - копия основной базы."""
+
+    def test_copy_database_makes_local_replica(self):
+        user = User.objects.create_user(username='user')
+        Post.objects.create(author=user, text='Test post')
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'replica.sqlite3')
+        try:
+            replicas.copy_database(path)
+            with sqlite3.connect(path) as replica:
+                count, = replica.execute(
+                    'SELECT COUNT(*) FROM posts_post').fetchone()
+            self.assertEqual(count, 1)
+        finally:
+            os.remove(path)
+            os.rmdir(directory)
@@ -0,0 +1,50 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from posts.models import Comment, Follow, Group, Post, User, UserStats
+from posts.seeding import Shape, seed, zipf_cum_weights
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class TestSeed(TestCase):
+    """Команда seed: объемы, счетчики и неравномерность активности."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        seed(Shape(users=50, groups=3, posts=400, comments=300, follows=200,
+                   images=0.5), workers=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_volumes(self):
+        self.assertEqual(User.objects.count(), 50)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 400)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertLessEqual(Follow.objects.count(), 200)
+        self.assertTrue(Post.objects.exclude(image='').exists())
+
+    def test_counters_for_every_user(self):
+        """Строки счетчиков есть у всех, даже у молчащих пользователей."""
+        self.assertEqual(UserStats.objects.count(), 50)
+        self.assertEqual(
+            sum(UserStats.objects.values_list('posts_count', flat=True)),
+            400)
+
+    def test_activity_follows_power_law(self):
+        """Самый активный автор пишет много больше среднего."""
+        top = UserStats.objects.order_by('-posts_count').first()
+        self.assertGreater(top.posts_count, 4 * 400 / 50)
+
+    def test_zipf_weights(self):
+        weights = zipf_cum_weights(3, 1)
+        self.assertEqual(weights, [1, 1.5, 1.5 + 1 / 3])
@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import tempfile
+import threading
+
+from django.db import connections
+from django.test import SimpleTestCase
+
+from core.db.sqlite.base import PRAGMAS
+from posts import benchmark
+
+
+class TestSQLiteBackend(SimpleTestCase):
+    """Подключение core.db.sqlite: прагмы и повтор при блокировке."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.sqlite3')
+        self.aliases = []
+
+    def tearDown(self):
+        for alias in self.aliases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def connect(self, **settings):
+        alias = f'sqlite_test_{len(self.aliases)}'
+        connections.databases[alias] = dict(
+            ENGINE='core.db.sqlite', NAME=self.path, **settings)
+        connections.ensure_defaults(alias)
+        connections.prepare_test_settings(alias)
+        self.aliases.append(alias)
+        return connections[alias]
+
+    def test_pragmas_applied_on_connect(self):
+        with self.connect().cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], PRAGMAS['busy_timeout'])
+
+    def test_locked_write_is_retried(self):
+        """Запись, упершаяся в чужую блокировку, повторяется."""
+        connection = self.connect(
+            OPTIONS={'timeout': 0}, PRAGMAS={'busy_timeout': 0})
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+        other = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False)
+        other.execute('BEGIN IMMEDIATE')
+        release = threading.Timer(0.1, other.commit)
+        release.start()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('INSERT INTO item (id) VALUES (1)')
+                cursor.execute('SELECT COUNT(*) FROM item')
+                self.assertEqual(cursor.fetchone()[0], 1)
+        finally:
+            release.join()
+            other.close()
+
+    def test_workload_benchmark(self):
+        for name in benchmark.SQLITE_CONFIGS:
+            with self.subTest(config=name):
+                result = benchmark.sqlite_workload(
+                    name, os.path.join(self.directory, f'{name}.sqlite3'),
+                    readers=2, writers=2, seconds=0.3, posts=50)
+                self.assertGreater(result['read']['ops_per_second'], 0)
+                self.assertGreater(result['write']['ops_per_second'], 0)
@@ -0,0 +1,133 @@
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts import thumbnails
+from posts.kvstore import KVStore
+from posts.models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class TestThumbnailKVStore(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='user')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, name):
+        post = Post.objects.create(
+            text='Text', author=self.user,
+            image=SimpleUploadedFile(name, SMALL_GIF, 'image/gif'))
+        thumbnails.generate(
+            post.image.name,
+            settings.POST_THUMBNAIL_GEOMETRY,
+            settings.POST_THUMBNAIL_OPTIONS,
+        )
+        return post
+
+    def thumbnail(self, post):
+        return default.backend.get_thumbnail(
+            post.image, settings.POST_THUMBNAIL_GEOMETRY,
+            **settings.POST_THUMBNAIL_OPTIONS)
+
+    def test_hot_thumbnails_are_served_without_queries(self):
+        """Повторный поиск миниатюры не ходит ни в кэш, ни в базу"""
+        post = self.create_post('lru.gif')
+        hits = default.kvstore.stats()['hits']
+        with self.assertNumQueries(0):
+            url = self.thumbnail(post).url
+        self.assertNotEqual(url, thumbnails.PlaceholderImage('1x1').url)
+        self.assertGreater(default.kvstore.stats()['hits'], hits)
+
+    @override_settings(THUMBNAIL_LRU_SIZE=2)
+    def test_lru_is_bounded(self):
+        """LRU хранит не больше THUMBNAIL_LRU_SIZE ключей"""
+        store = KVStore()
+        for number in range(5):
+            store._set_raw(f'key-{number}', 'value')
+        self.assertEqual(store.stats()['size'], 2)
+        self.assertEqual(store._get_raw('key-4'), 'value')
+        self.assertEqual(store.stats()['hits'], 1)
+
+    def test_lru_entries_expire(self):
+        """Запись LRU живет не дольше THUMBNAIL_LRU_TTL: удаление в другом
+        процессе этот LRU не сбрасывает"""
+        store, other = KVStore(), KVStore()
+        store._set_raw('key', 'value')
+        other._delete_raw('key')
+        self.assertEqual(store._get_raw('key'), 'value')
+        with mock.patch('posts.kvstore.time.monotonic',
+                        return_value=time.monotonic()
+                        + settings.THUMBNAIL_LRU_TTL + 1):
+            self.assertIsNone(store._get_raw('key'))
+        self.assertEqual(store.stats()['size'], 0)
+
+    def test_image_change_and_delete_invalidate_thumbnails(self):
+        """Смена картинки и удаление поста сбрасывают миниатюры"""
+        post = self.create_post('old.gif')
+        old_name = post.image.name
+        post.image = SimpleUploadedFile('new.gif', SMALL_GIF, 'image/gif')
+        post.save()
+        self.assertIsNone(default.kvstore.get(ImageFile(old_name)))
+        thumbnails.generate(
+            post.image.name,
+            settings.POST_THUMBNAIL_GEOMETRY,
+            settings.POST_THUMBNAIL_OPTIONS,
+        )
+        new_name = post.image.name
+        self.assertIsNotNone(default.kvstore.get(ImageFile(new_name)))
+        post.delete()
+        self.assertIsNone(default.kvstore.get(ImageFile(new_name)))
+
+    def test_broken_image_stops_being_queued(self):
+        """Битая картинка после нескольких попыток дает окончательную
+        заглушку и больше не ставится в очередь"""
+        post = Post.objects.create(
+            text='Text', author=self.user,
+            image=SimpleUploadedFile('broken.gif', b'not a gif', 'image/gif'))
+        job = thumbnails.job_for(
+            post.image.name,
+            settings.POST_THUMBNAIL_GEOMETRY,
+            settings.POST_THUMBNAIL_OPTIONS,
+        )
+        cache.delete(thumbnails.FAILED_KEY.format(
+            default.backend.thumbnail_file(
+                ImageFile(post.image.name),
+                settings.POST_THUMBNAIL_GEOMETRY,
+                settings.POST_THUMBNAIL_OPTIONS,
+            ).key))
+        with override_settings(THUMBNAIL_WORKERS=0):
+            for _ in range(settings.THUMBNAIL_MAX_ATTEMPTS):
+                thumbnails.reset_placeholders()
+                self.thumbnail(post)
+                self.assertEqual(thumbnails.placeholders_rendered(), 1)
+                thumbnails._submit(job)
+        thumbnails.reset_placeholders()
+        with mock.patch.object(thumbnails, 'enqueue') as enqueue:
+            url = self.thumbnail(post).url
+        enqueue.assert_not_called()
+        self.assertEqual(url, thumbnails.PlaceholderImage('1x1').url)
+        self.assertEqual(thumbnails.placeholders_rendered(), 0)
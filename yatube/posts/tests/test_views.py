@@ -1,14 +1,32 @@
+import base64
+import json
 import shutil
 import tempfile
+import time
+from io import StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.templatetags.static import static
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from posts.models import Follow, Group, Post, User
+from posts import bundles
+from posts import cache as page_cache
+from posts import counters
+from posts import search as post_search
+from posts import thumbnails
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry,
+                          User)
+from posts.pagination import (InvalidCursor, WindowedPaginator,
+                              decode_cursor, encode_cursor)
+from posts.tests.utils import run_on_commit
 
 POSTS_COUNT = 57
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -82,6 +100,13 @@ class TestViews(TestCase):
             image=cls.uploaded_2,
         )
 
+        for post in Post.objects.all():
+            thumbnails.generate(
+                post.image.name,
+                settings.POST_THUMBNAIL_GEOMETRY,
+                settings.POST_THUMBNAIL_OPTIONS,
+            )
+
         cls.index_page = 'posts:index'
         cls.group_list_page = 'posts:group_list'
         cls.profile_page = 'posts:profile'
@@ -126,6 +151,26 @@ class TestViews(TestCase):
         self.assertIn('page_obj', response.context)
         self.assertEqual(post_object.image, self.post.image)
 
+    def test_listings_read_excerpt_instead_of_text(self):
+        """Ленты не читают полный текст, длинный пост ведет на post_detail."""
+        post = Post.objects.create(
+            author=self.user1, group=self.group1, text='Длинный пост ' * 100)
+        detail = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        pages = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group1.slug}),
+            reverse('posts:profile', kwargs={'username': self.user1}),
+        ]
+        for page in pages:
+            with self.subTest(page=page):
+                cache.clear()
+                response = self.guest_client.get(page)
+                post_object = response.context['page_obj'][0]
+                self.assertIn('text', post_object.get_deferred_fields())
+                self.assertContains(response, post.excerpt)
+                self.assertNotContains(response, post.text)
+                self.assertContains(response, f'href="{detail}">Читать')
+
     # checking context of group_list
     def test_group_page_show_correct_context(self):
         """Шаблон group_list сформирован с правильным контекстом."""
@@ -201,12 +246,173 @@ class TestViews(TestCase):
         response_1 = self.authorized_client.get(reverse(self.index_page))
         response_before_del = response_1.context['page_obj'][0]
         self.assertEqual(post, response_before_del)
-        post.delete()
         response_2 = self.authorized_client.get(reverse(self.index_page))
+        self.assertTemplateNotUsed(response_2, 'posts/index.html')
         self.assertEqual(response_1.content, response_2.content)
-        cache.clear()
+        with run_on_commit():
+            post.delete()
         response_3 = self.authorized_client.get(reverse(self.index_page))
         self.assertNotEqual(response_1.content, response_3.content)
+        self.assertNotIn(post, response_3.context['page_obj'])
+
+    def test_cache_invalidated_by_scope(self):
+        """Изменения сбрасывают кэш группы и профиля только своей области"""
+        group_page = 'posts/group_list.html'
+        profile_page = 'posts/profile.html'
+        pages = {
+            reverse(self.group_list_page, kwargs={'slug': self.group1.slug}):
+                (group_page, True),
+            reverse(self.group_list_page, kwargs={'slug': self.group2.slug}):
+                (group_page, False),
+            reverse(self.profile_page, kwargs={'username': self.user1}):
+                (profile_page, True),
+            reverse(self.profile_page, kwargs={'username': self.user2}):
+                (profile_page, False),
+        }
+        for page in pages:
+            self.guest_client.get(page)
+        with run_on_commit():
+            Post.objects.create(
+                text='Testing text', author=self.user1, group=self.group1)
+        for page, (template, invalidated) in pages.items():
+            with self.subTest(page=page):
+                response = self.guest_client.get(page)
+                if invalidated:
+                    self.assertTemplateUsed(response, template)
+                else:
+                    self.assertTemplateNotUsed(response, template)
+
+    def test_shared_cache_fills_personal_fragments(self):
+        """Общая копия страницы получает персональные фрагменты"""
+        page = reverse(self.profile_page, kwargs={'username': self.user1})
+        guest_response = self.guest_client.get(page)
+        self.assertContains(guest_response, 'Войти')
+        author_client = Client()
+        author_client.force_login(self.user1)
+        author_response = author_client.get(page)
+        self.assertTemplateNotUsed(author_response, 'posts/profile.html')
+        self.assertContains(author_response, 'Выйти')
+        self.assertContains(author_response, 'редактировать запись')
+        self.assertNotContains(guest_response, 'редактировать запись')
+        self.assertNotContains(author_response, '<!--fragment:')
+
+    def hold_lease(self, url):
+        """Аренду перестройки держит другой воркер."""
+        key = page_cache.page_key('index', 'http://testserver' + url)
+        lease = page_cache.LEASE_KEY.format(key)
+        cache.set(lease, 'other', 30)
+        return lease
+
+    def test_stale_page_served_while_rebuilding(self):
+        """Пока страницу перестраивает другой воркер, отдается старая"""
+        page = reverse(self.index_page)
+        self.guest_client.get(page)
+        with run_on_commit():
+            post = Post.objects.create(text='Свежий пост', author=self.user1)
+        lease = self.hold_lease(page)
+        page_cache.reset_page_cache_stats()
+        response = self.guest_client.get(page)
+        self.assertTemplateNotUsed(response, 'posts/index.html')
+        self.assertNotContains(response, post.text)
+        self.assertEqual(page_cache.page_cache_stats()['stale'], 1)
+        cache.delete(lease)
+        response = self.guest_client.get(page)
+        self.assertContains(response, post.text)
+        self.assertEqual(page_cache.page_cache_stats()['render'], 1)
+
+    def test_stale_after_fresh_timeout(self):
+        """После мягкого TTL копию перестраивает первый запрос"""
+        page = reverse(self.index_page)
+        with self.settings(PAGE_CACHE_FRESH_TIMEOUT=0):
+            self.guest_client.get(page)
+            response = self.guest_client.get(page)
+            self.assertTemplateUsed(response, 'posts/index.html')
+            self.hold_lease(page)
+            response = self.guest_client.get(page)
+            self.assertTemplateNotUsed(response, 'posts/index.html')
+
+    def test_first_copy_rendered_after_lease_wait(self):
+        """Без копии воркер ждет чужую перестройку не дольше LEASE_WAIT"""
+        page = reverse(self.index_page)
+        self.hold_lease(page)
+        page_cache.reset_page_cache_stats()
+        with self.settings(PAGE_CACHE_LEASE_WAIT=0):
+            response = self.guest_client.get(page)
+        self.assertTemplateUsed(response, 'posts/index.html')
+        self.assertEqual(page_cache.page_cache_stats()['render'], 1)
+
+    def test_waiting_stops_when_lease_released(self):
+        """Аренду сняли без копии - воркер рендерит сам, не дожидаясь
+        конца LEASE_WAIT"""
+        page = reverse(self.index_page)
+        key = page_cache.page_key('index', 'http://testserver' + page)
+        cache.set(page_cache.LEASE_KEY.format(key), 'other', 0.2)
+        page_cache.reset_page_cache_stats()
+        started = time.monotonic()
+        with self.settings(PAGE_CACHE_LEASE_WAIT=30):
+            response = self.guest_client.get(page)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertTemplateUsed(response, 'posts/index.html')
+        self.assertEqual(page_cache.page_cache_stats()['render'], 1)
+
+    def card_renders(self, response):
+        return [template.name for template in response.templates].count(
+            'includes/post_card.html')
+
+    def test_edit_rerenders_only_its_card(self):
+        """Правка поста рендерит заново только его карточку"""
+        page = reverse(self.index_page)
+        self.assertEqual(self.card_renders(self.guest_client.get(page)), 2)
+        with run_on_commit():
+            self.authorized_client.post(
+                reverse(
+                    self.post_edit_page, kwargs={'post_id': self.post.pk}),
+                {'text': 'Исправленный текст', 'group': self.group2.pk})
+        response = self.guest_client.get(page)
+        self.assertTemplateUsed(response, 'posts/index.html')
+        self.assertEqual(self.card_renders(response), 1)
+        self.assertContains(response, 'Исправленный текст')
+
+    @override_settings(POST_CARD_TIMEOUT=123)
+    def test_cards_cached_with_card_timeout(self):
+        """Карточки кладутся в кэш на POST_CARD_TIMEOUT"""
+        with mock.patch('posts.cards.cache', wraps=cache) as card_cache:
+            self.guest_client.get(reverse(self.index_page))
+        cards, timeout = card_cache.set_many.call_args[0]
+        self.assertEqual(len(cards), 2)
+        self.assertEqual(timeout, 123)
+
+    def test_author_name_change_rerenders_cards(self):
+        """Смена имени автора обновляет его карточки на всех лентах"""
+        page = reverse(self.group_list_page, kwargs={'slug': self.group2.slug})
+        self.guest_client.get(page)
+        self.user2.first_name = 'Новое'
+        self.user2.last_name = 'Имя'
+        with run_on_commit():
+            self.user2.save()
+        response = self.guest_client.get(page)
+        self.assertEqual(self.card_renders(response), 1)
+        self.assertContains(response, 'Новое Имя')
+
+    def test_missing_thumbnail_renders_placeholder(self):
+        """Без готовой миниатюры лента показывает заглушку и не кэшируется"""
+        uploaded = SimpleUploadedFile(
+            name='new3.gif', content=self.small_gif_1,
+            content_type='image/gif')
+        Post.objects.create(
+            text='Fresh image', author=self.user1, image=uploaded)
+        placeholder = static(settings.THUMBNAIL_PLACEHOLDER)
+        self.assertContains(
+            self.guest_client.get(reverse(self.index_page)), placeholder)
+        response = self.guest_client.get(reverse(self.index_page))
+        self.assertTemplateUsed(response, 'posts/index.html')
+        thumbnails.generate(
+            'posts/new3.gif',
+            settings.POST_THUMBNAIL_GEOMETRY,
+            settings.POST_THUMBNAIL_OPTIONS,
+        )
+        self.assertNotContains(
+            self.guest_client.get(reverse(self.index_page)), placeholder)
 
 
 class TestPaginator(TestCase):
@@ -275,6 +481,41 @@ class TestPaginator(TestCase):
                 self.assertEqual(len(response_obj2.context['page_obj']),
                                  self.amount_of_post_last_page)
 
+    @override_settings(EXACT_COUNT_LIMIT=10)
+    def test_large_listings_take_count_from_counters(self):
+        '''Большие ленты берут число постов из счетчиков, без COUNT(*)'''
+        # bulk_create в setUpClass не вызывает сигналы счетчиков
+        counters.rebuild_user_stats([self.user.pk])
+        for page in self.pages:
+            with self.subTest(page=page):
+                self.authorized_client.get(page)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.authorized_client.get(page + '?page=2')
+                self.assertEqual(
+                    response.context['page_obj'].paginator.num_pages,
+                    self.amount_of_pages + 1)
+                self.assertFalse([
+                    query for query in queries.captured_queries
+                    if 'COUNT(' in query['sql']])
+
+    def test_elided_page_range(self):
+        '''Номера страниц выводятся окном вокруг текущей'''
+        paginator = WindowedPaginator(range(1000), 10)
+        ellipsis = WindowedPaginator.ELLIPSIS
+        self.assertEqual(
+            list(paginator.get_elided_page_range(50)),
+            [1, 2, ellipsis, 47, 48, 49, 50, 51, 52, 53, ellipsis, 99, 100])
+        self.assertEqual(
+            list(paginator.get_elided_page_range(1)),
+            [1, 2, 3, 4, ellipsis, 99, 100])
+        self.assertEqual(
+            list(WindowedPaginator(range(50), 10).get_elided_page_range(3)),
+            [1, 2, 3, 4, 5])
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(
+            list(response.context['page_obj'].elided_page_range),
+            list(range(1, self.amount_of_pages + 2)))
+
 
 class FollowingTest(TestCase):
     """Тест подписок на автора поста"""
@@ -321,3 +562,462 @@ class FollowingTest(TestCase):
         test_post2 = response_obj_2.context['page_obj']
         self.assertIn(post, test_post1)
         self.assertNotIn(post, test_post2)
+
+    def test_follow_backfills_and_unfollow_cleans_timeline(self):
+        """Подписка заполняет ленту старыми постами, отписка чистит ее"""
+        post = Post.objects.create(author=self.user3, text='Old text')
+        page = reverse('posts:follow_index')
+        self.authorized_user2.get(
+            reverse('posts:profile_follow', kwargs={'username': self.user3}))
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user2, post=post).exists())
+        self.assertIn(
+            post, self.authorized_user2.get(page).context['page_obj'])
+        self.authorized_user2.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.user3}))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user2))
+        self.assertNotIn(
+            post, self.authorized_user2.get(page).context['page_obj'])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_big_author_posts_are_read_without_fan_out(self):
+        """Посты популярного автора попадают в ленту при чтении"""
+        Follow.objects.create(user=self.user1, author=self.user3)
+        post = Post.objects.create(author=self.user3, text='Test text')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        response = self.authorized_user1.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_timeline_filled_when_author_is_no_longer_big(self):
+        """Посты, написанные, пока автор был крупным, остаются в ленте
+        после того, как подписчиков стало меньше"""
+        Follow.objects.create(user=self.user1, author=self.user3)
+        Follow.objects.create(user=self.user2, author=self.user3)
+        post = Post.objects.create(author=self.user3, text='Test text')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.authorized_user2.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.user3}))
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user1, post=post).exists())
+        response = self.authorized_user1.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+
+@override_settings(POSTS_PAGINATION='cursor')
+class TestCursorPaginator(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='user')
+        cls.group = Group.objects.create(
+            title='Test title',
+            slug='test-slug',
+            description='Test description',
+        )
+        cls.guest_client = Client()
+        Post.objects.bulk_create(Post(
+            text=f'Test post number {post}',
+            author=cls.user,
+            group=cls.group,) for post in range(POSTS_COUNT))
+        cls.pages = [
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': cls.user}),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, page, key, cursor):
+        response = self.guest_client.get(page, {key: cursor})
+        return response.context['page_obj']
+
+    def test_cursor_pages_cover_all_posts_in_order(self):
+        '''Курсоры проходят все посты по порядку без пропусков и повторов'''
+        expected = list(
+            Post.objects.order_by('-pub_date', '-id')
+            .values_list('id', flat=True))
+        for page in self.pages:
+            with self.subTest(page=page):
+                page_obj = self.guest_client.get(page).context['page_obj']
+                self.assertFalse(page_obj.has_previous())
+                seen = [post.id for post in page_obj]
+                while page_obj.has_next():
+                    page_obj = self.walk(
+                        page, 'after', page_obj.next_cursor)
+                    self.assertLessEqual(
+                        len(page_obj), settings.POSTS_PER_PAGE)
+                    seen.extend(post.id for post in page_obj)
+                self.assertEqual(seen, expected)
+                self.assertEqual(
+                    len(page_obj), POSTS_COUNT % settings.POSTS_PER_PAGE)
+
+    def test_before_cursor_returns_previous_page(self):
+        '''Токен before возвращает предыдущую страницу'''
+        first = self.guest_client.get(self.pages[0]).context['page_obj']
+        second = self.walk(self.pages[0], 'after', first.next_cursor)
+        back = self.walk(self.pages[0], 'before', second.previous_cursor)
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        '''Битый токен ведет на первую страницу'''
+        first = self.guest_client.get(self.pages[0]).context['page_obj']
+        broken = self.walk(self.pages[0], 'after', 'not-a-cursor')
+        self.assertEqual(list(broken), list(first))
+
+    def test_cursor_past_the_end_gives_empty_page(self):
+        '''Курсор за последним постом дает пустую страницу, а не 500'''
+        oldest = Post.objects.order_by('pub_date', 'id').first()
+        pages = {
+            self.pages[0]: encode_cursor([oldest.pub_date, oldest.pk]),
+            reverse('posts:search'): encode_cursor([1e9, 0]),
+        }
+        for page, cursor in pages.items():
+            with self.subTest(page=page):
+                response = self.guest_client.get(
+                    page, {'q': 'post', 'after': cursor})
+                self.assertEqual(response.status_code, 200)
+                page_obj = response.context['page_obj']
+                self.assertEqual(len(page_obj), 0)
+                self.assertIsNone(page_obj.previous_cursor)
+                self.assertNotIn('before=', page_obj.previous_query)
+
+    def test_cursor_values_are_checked_by_field_type(self):
+        '''Значения не того типа в токене считаются битым курсором'''
+        post = Post.objects.first()
+        url = reverse('posts:post_comments', kwargs={'post_id': post.pk})
+        tokens = [
+            [5, 5],
+            [post.pub_date.isoformat(), post.pub_date.isoformat()],
+            [post.pub_date.isoformat(), True],
+            [post.pub_date.isoformat(), 2 ** 70],
+        ]
+        for values in tokens:
+            with self.subTest(values=values):
+                token = base64.urlsafe_b64encode(
+                    json.dumps(values).encode()).decode()
+                response = self.guest_client.get(url, {'after': token})
+                self.assertEqual(response.status_code, 200)
+        token = base64.urlsafe_b64encode(
+            b'["2020-01-01T00:00:00+00:00",1e400]').decode()
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(token, ['datetime', 'int'])
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(token, ['datetime', 'float'])
+
+
+class TestComments(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='user')
+        cls.post = Post.objects.create(text='Test post', author=cls.user)
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'Comment {number}')
+            for number in range(POSTS_COUNT))
+        cls.guest_client = Client()
+
+    def test_post_detail_shows_first_comments(self):
+        '''На post_detail только первая порция, новые сверху'''
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), settings.COMMENTS_PER_PAGE)
+        self.assertEqual(
+            [comment.pk for comment in comments],
+            list(Comment.objects.values_list(
+                'pk', flat=True)[:settings.COMMENTS_PER_PAGE]))
+        self.assertContains(response, reverse(
+            'posts:post_comments', kwargs={'post_id': self.post.pk}))
+
+    def test_fragments_load_all_comments(self):
+        '''Подгрузка по курсору проходит все комментарии без повторов'''
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        comments = self.guest_client.get(url).context['comments']
+        seen = [comment.pk for comment in comments]
+        while comments.has_next():
+            response = self.guest_client.get(
+                url, {'after': comments.next_cursor})
+            self.assertTemplateUsed(response, 'includes/comment_list.html')
+            comments = response.context['comments']
+            seen.extend(comment.pk for comment in comments)
+        self.assertEqual(
+            seen, list(Comment.objects.values_list('pk', flat=True)))
+
+    def test_fragment_of_missing_post(self):
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_post_detail_read_through_bundle(self):
+        '''Повторный post_detail собирается из кэша без запросов к базе'''
+        cache.clear()
+        bundles.reset_bundle_stats()
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        first = self.guest_client.get(url)
+        with self.assertNumQueries(0):
+            second = self.guest_client.get(url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(bundles.bundle_stats(), {'hits': 1, 'misses': 1})
+        self.assertEqual(
+            self.guest_client.get(
+                reverse('posts:post_detail', kwargs={'post_id': 0})
+            ).status_code, 404)
+
+    @override_settings(CACHE_STATS_FLUSH_INTERVAL=0)
+    def test_cache_stats_are_shared(self):
+        """Счетчики кэшей попадают в общий кэш и видны cache_stats"""
+        cache.clear()
+        bundles.reset_bundle_stats()
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.guest_client.get(url)
+        self.guest_client.get(url)
+        self.assertEqual(
+            bundles.stats.shared(), {'hits': 1, 'misses': 1})
+        output = StringIO()
+        call_command('cache_stats', reset=True, stdout=output)
+        self.assertIn('post_bundles: hits 1, misses 1', output.getvalue())
+        self.assertEqual(
+            bundles.stats.shared(), {'hits': 0, 'misses': 0})
+
+    def test_bundle_built_during_bump_is_not_reused(self):
+        '''Сброс во время сборки кэша поста не закрепляет старые данные'''
+        cache.clear()
+        user_stats = counters.user_stats
+
+        def bump_while_building(user):
+            page_cache.bump(bundles.AUTHOR_POSTS_SCOPE.format(user.pk))
+            return user_stats(user)
+
+        with mock.patch.object(
+                counters, 'user_stats', side_effect=bump_while_building):
+            bundles.load(self.post.pk)
+        bundles.reset_bundle_stats()
+        bundles.load(self.post.pk)
+        self.assertEqual(bundles.bundle_stats(), {'hits': 0, 'misses': 1})
+
+    def test_bundle_follows_writes(self):
+        '''Комментарий, правка и новый пост автора сбрасывают кэш поста'''
+        cache.clear()
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.guest_client.get(url)
+        with run_on_commit():
+            Comment.objects.create(
+                post=self.post, author=self.user, text='Свежий комментарий')
+        response = self.guest_client.get(url)
+        self.assertEqual(
+            response.context['comments'][0].text, 'Свежий комментарий')
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный пост'
+        with run_on_commit():
+            post.save()
+        self.assertContains(self.guest_client.get(url), 'Исправленный пост')
+        with run_on_commit():
+            Post.objects.create(text='Другой пост', author=self.user)
+        response = self.guest_client.get(url)
+        self.assertEqual(
+            response.context['post'].author.stats.posts_count, 2)
+
+
+class TestSearch(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='user')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Test title',
+            slug='test-slug',
+            description='Test description',
+        )
+        cls.guest_client = Client()
+        cls.relevant = Post.objects.create(
+            text='Котики котики котики', author=cls.user, group=cls.group)
+        cls.less_relevant = Post.objects.create(
+            text='Про котики и длинный текст о собаках и погоде '
+                 'и еще много разных слов',
+            author=cls.other)
+        cls.unrelated = Post.objects.create(
+            text='Собаки', author=cls.user)
+
+    def search(self, **params):
+        response = self.guest_client.get(reverse('posts:search'), params)
+        return list(response.context['page_obj'])
+
+    def test_search_ranks_matches(self):
+        """Поиск находит посты и ставит более релевантные выше"""
+        self.assertEqual(
+            self.search(q='КОТИКИ'), [self.relevant, self.less_relevant])
+
+    def test_search_filters_by_group_and_author(self):
+        """Поиск фильтруется по группе и автору"""
+        self.assertEqual(
+            self.search(q='котики', group=self.group.slug), [self.relevant])
+        self.assertEqual(
+            self.search(q='котики', author=self.other.username),
+            [self.less_relevant])
+
+    def test_search_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при правке и удалении поста"""
+        edited = Post.objects.get(pk=self.unrelated.pk)
+        edited.text = 'Теперь про котики'
+        edited.save()
+        self.assertIn(edited, self.search(q='котики'))
+        self.assertEqual(self.search(q='собаки'), [])
+        Post.objects.get(pk=self.relevant.pk).delete()
+        self.assertNotIn(self.relevant, self.search(q='котики'))
+
+    def test_search_is_paginated_by_cursor(self):
+        """Выдача листается курсором и сохраняет запрос в ссылках"""
+        Post.objects.bulk_create(
+            Post(text=f'Котики номер {number}', author=self.user)
+            for number in range(POSTS_COUNT))
+        post_search.rebuild()
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': 'котики'})
+        page_obj = response.context['page_obj']
+        self.assertContains(response, 'q=%D0%BA%D0%BE%D1%82%D0%B8%D0%BA%D0%B8')
+        seen = [post.id for post in page_obj]
+        while page_obj.has_next():
+            page_obj = self.guest_client.get(
+                reverse('posts:search') + '?' + page_obj.next_query
+            ).context['page_obj']
+            seen.extend(post.id for post in page_obj)
+        self.assertEqual(len(seen), POSTS_COUNT + 2)
+        self.assertEqual(len(set(seen)), POSTS_COUNT + 2)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке находит посты через индекс"""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        client = Client()
+        client.force_login(admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'собаки'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.unrelated])
+
+    def test_admin_search_without_words(self):
+        """Запрос из одних знаков препинания в админке ничего не находит"""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        client = Client()
+        client.force_login(admin)
+        for term in ('?', '-'):
+            with self.subTest(term=term):
+                response = client.get(
+                    reverse('admin:posts_post_changelist'), {'q': term})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    list(response.context['cl'].result_list), [])
+
+
+class TestConditionalGet(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.reader_client = Client()
+        cls.reader_client.force_login(cls.reader)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='Пост', author=self.author, group=self.group)
+        self.guest_client = Client()
+
+    def assertNotModified(self, client, url, **headers):
+        with self.assertNumQueries(0):
+            response = client.get(url, **headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_unchanged_listings_answer_304(self):
+        """Ленты отдают 304 без рендера, пока поколение не сменилось"""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                etag = response['ETag']
+                self.assertIn('Last-Modified', response)
+                self.assertNotModified(
+                    self.guest_client, url, HTTP_IF_NONE_MATCH=etag)
+                self.assertNotModified(
+                    self.guest_client, url,
+                    HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertNotEqual(
+                    self.reader_client.get(url)['ETag'], etag)
+        with run_on_commit():
+            Post.objects.create(
+                text='Новый', author=self.author, group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_post_detail_follows_comments(self):
+        """post_detail отдает 304, пока нет новых комментариев и правок"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.guest_client.get(url)['ETag']
+        self.assertNotModified(self.guest_client, url, HTTP_IF_NONE_MATCH=etag)
+        with run_on_commit():
+            Comment.objects.create(
+                post=self.post, author=self.reader, text='Комментарий')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Комментарий')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_changes_after_commit(self):
+        """ETag меняется после коммита записи, а не до него: иначе клиент
+        закрепил бы новым ETag страницу из незакоммиченных данных"""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        etags = {url: self.guest_client.get(url)['ETag'] for url in urls}
+        with run_on_commit():
+            Post.objects.create(text='Новый', author=self.author)
+            Comment.objects.create(
+                post=self.post, author=self.reader, text='Комментарий')
+            for url in urls:
+                with self.subTest(url=url, committed=False):
+                    self.assertEqual(
+                        self.guest_client.get(url)['ETag'], etags[url])
+        for url in urls:
+            with self.subTest(url=url, committed=True):
+                self.assertNotEqual(
+                    self.guest_client.get(url)['ETag'], etags[url])
+
+    def test_follow_index_follows_subscriptions(self):
+        """Подписка меняет ETag ленты подписок"""
+        url = reverse('posts:follow_index')
+        etag = self.reader_client.get(url)['ETag']
+        self.assertEqual(self.reader_client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with run_on_commit():
+            Follow.objects.create(user=self.reader, author=self.author)
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, self.post.text)
+
+    def test_stale_copy_has_no_validators(self):
+        """Устаревшая копия страницы уходит без ETag и с no-store"""
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        with run_on_commit():
+            Post.objects.create(text='Новый', author=self.author)
+        key = page_cache.page_key('index', 'http://testserver' + url)
+        cache.set(page_cache.LEASE_KEY.format(key), 'other', 30)
+        response = self.guest_client.get(url)
+        self.assertNotIn('ETag', response)
+        self.assertIn('no-store', response['Cache-Control'])
@@ -0,0 +1,19 @@
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def run_on_commit():
+    """Выполняет on_commit-колбэки, добавленные в блоке, как при коммите.
+
+    TestCase держит тест в транзакции, и в Django 2.2 колбэки не
+    вызываются никогда (captureOnCommitCallbacks появился в 3.2).
+    """
+    callbacks = connection.run_on_commit
+    start = len(callbacks)
+    yield
+    # Колбэк может добавить новые - выполняем, пока они есть
+    while len(callbacks) > start:
+        sids, callback = callbacks.pop(start)
+        callback()
@@ -0,0 +1,204 @@
+"""Фоновая генерация миниатюр картинок постов.
+
+Миниатюры создаются в локальном пуле процессов сразу после сохранения
+поста. Пока миниатюры нет, {% thumbnail %} не ресайзит картинку внутри
+рендера, а отдает заглушку и ставит генерацию в очередь. Неудачные
+попытки считаются в общем кэше: после THUMBNAIL_MAX_ATTEMPTS картинка
+считается битой, заглушка для нее окончательная и страницы с ней
+снова кэшируются.
+"""
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.templatetags.static import static
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import DummyImageFile, ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+
+logger = logging.getLogger(__name__)
+
+FAILED_KEY = 'thumbnail_failed:{}'
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+_local = threading.local()
+
+
+class PlaceholderImage(DummyImageFile):
+    @property
+    def url(self):
+        return static(settings.THUMBNAIL_PLACEHOLDER)
+
+
+class QueuedThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который не создает миниатюры во время рендера."""
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        source = ImageFile(file_)
+        thumbnail = self.thumbnail_file(source, geometry_string, options)
+        cached = default.kvstore.get(thumbnail)
+        if cached:
+            return cached
+        if has_failed(thumbnail):
+            return PlaceholderImage(geometry_string)
+        enqueue(source.name, geometry_string, options)
+        _local.placeholders = getattr(_local, 'placeholders', 0) + 1
+        return PlaceholderImage(geometry_string)
+
+    def thumbnail_file(self, source, geometry_string, options):
+        name = self._get_thumbnail_filename(
+            source, geometry_string, self._full_options(source, options))
+        return ImageFile(name, default.storage)
+
+    def _full_options(self, source, options):
+        # Те же умолчания, что в ThumbnailBackend.get_thumbnail
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+
+def reset_placeholders():
+    _local.placeholders = 0
+
+
+def placeholders_rendered():
+    """Сколько заглушек отдано в текущем потоке после reset_placeholders."""
+    return getattr(_local, 'placeholders', 0)
+
+
+def _init_worker():
+    django.setup()
+    # Соединения родителя нельзя использовать из дочернего процесса
+    connections.close_all()
+
+
+def has_failed(thumbnail):
+    """Исчерпаны ли попытки создать миниатюру."""
+    attempts = cache.get(FAILED_KEY.format(thumbnail.key), 0)
+    return attempts >= settings.THUMBNAIL_MAX_ATTEMPTS
+
+
+def _record_failure(thumbnail):
+    key = FAILED_KEY.format(thumbnail.key)
+    cache.add(key, 0, settings.THUMBNAIL_FAILURE_TIMEOUT)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Запись успела истечь между add и incr
+        cache.add(key, 1, settings.THUMBNAIL_FAILURE_TIMEOUT)
+
+
+def generate(name, geometry_string, options):
+    """Создает миниатюру синхронно; в работе вызывается в процессе пула.
+
+    Возвращает ключ миниатюры в KVStore или None, если создать ее не
+    удалось.
+    """
+    thumbnail = default.backend.thumbnail_file(
+        ImageFile(name), geometry_string, options)
+    try:
+        ThumbnailBackend.get_thumbnail(
+            default.backend, name, geometry_string, **options)
+    except Exception:
+        logger.exception('Thumbnail generation failed for %s', name)
+        _record_failure(thumbnail)
+        return None
+    # На пропавшем или битом исходнике sorl пишет в лог и не трогает KVStore
+    if not default.kvstore.get(thumbnail):
+        _record_failure(thumbnail)
+        return None
+    return thumbnail.key
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                initializer=_init_worker,
+            )
+        return _executor
+
+
+def _done(future, job):
+    _pending.discard(job)
+    if future.exception() is not None:
+        logger.error('Thumbnail generation failed for %s: %s',
+                     job[0], future.exception())
+        return
+    if future.result() is None:
+        return
+    # KVStore запомнил промах в кэше этого процесса, забываем его
+    default.kvstore.cache.delete(add_prefix(future.result()))
+
+
+def _submit(job):
+    global _executor
+    if job in _pending:
+        return
+    name, geometry_string, options = job
+    if settings.THUMBNAIL_WORKERS == 0:
+        generate(name, geometry_string, dict(options))
+        return
+    try:
+        future = _get_executor().submit(
+            generate, name, geometry_string, dict(options))
+    except (BrokenProcessPool, RuntimeError):
+        logger.exception('Thumbnail pool is broken, restarting it')
+        with _executor_lock:
+            _executor = None
+        return
+    _pending.add(job)
+    future.add_done_callback(lambda future: _done(future, job))
+
+
+def job_for(name, geometry_string, options):
+    return name, geometry_string, tuple(sorted(options.items()))
+
+
+def enqueue(name, geometry_string, options):
+    """Ставит миниатюру в очередь после коммита текущей транзакции."""
+    job = job_for(name, geometry_string, options)
+    transaction.on_commit(lambda: _submit(job))
+
+
+def pregenerate(post):
+    """Готовит миниатюры картинки поста для шаблонов лент."""
+    if post.image:
+        enqueue(post.image.name, settings.POST_THUMBNAIL_GEOMETRY,
+                settings.POST_THUMBNAIL_OPTIONS)
+
+
+def prefetch(posts):
+    """Читает записи KVStore миниатюр лент для постов одной пачкой."""
+    default.kvstore.prefetch([
+        default.backend.thumbnail_file(
+            ImageFile(post.image), settings.POST_THUMBNAIL_GEOMETRY,
+            settings.POST_THUMBNAIL_OPTIONS)
+        for post in posts if post.image
+    ])
+
+
+def forget(name):
+    """Удаляет миниатюры картинки и их записи в KVStore."""
+    default.kvstore.delete(ImageFile(name))
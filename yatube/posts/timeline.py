@@ -0,0 +1,154 @@
+"""Лента подписок с раздачей постов при записи (fan-out-on-write).
+
+Новый пост копируется в ленты всех подписчиков автора, и follow_index
+читает ленту одним диапазоном по индексу (user, -pub_date, -post). Посты
+авторов, у которых подписчиков больше TIMELINE_FANOUT_LIMIT, не
+раздаются: такие авторы подмешиваются в ленту при чтении. Когда
+подписчиков снова становится не больше предела, ленты подписчиков
+дозаполняются его постами (followers_dropped).
+"""
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import F, Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+BATCH_SIZE = 500
+# Ключ сортировки ленты: поля записи ленты, чтобы читать по ее индексу
+FEED_ORDERING = ('-feed_pub_date', '-feed_post_id')
+
+
+def fanout_limit():
+    return settings.TIMELINE_FANOUT_LIMIT
+
+
+def is_big_author(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id, followers_count__gt=fanout_limit()).exists()
+
+
+def _bulk_insert(entries):
+    # bulk_create собирает аргумент в список, поэтому отдаем его пачками
+    entries = iter(entries)
+    batch = list(islice(entries, BATCH_SIZE))
+    while batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        batch = list(islice(entries, BATCH_SIZE))
+
+
+def fan_out(post):
+    """Раздает новый пост в ленты подписчиков автора."""
+    if is_big_author(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    _bulk_insert(
+        TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+        for user_id in follower_ids.iterator(chunk_size=BATCH_SIZE)
+    )
+
+
+def backfill(follow):
+    """Заполняет ленту нового подписчика постами автора."""
+    if is_big_author(follow.author_id):
+        return
+    posts = (
+        Post.objects.filter(author_id=follow.author_id)
+        .values_list('id', 'pub_date').iterator(chunk_size=BATCH_SIZE)
+    )
+    _bulk_insert(
+        TimelineEntry(user_id=follow.user_id, post_id=post_id,
+                      pub_date=pub_date)
+        for post_id, pub_date in posts
+    )
+
+
+def _small_authors(author_ids):
+    big = set(UserStats.objects.filter(
+        user_id__in=author_ids, followers_count__gt=fanout_limit(),
+    ).values_list('user_id', flat=True))
+    return [author_id for author_id in author_ids if author_id not in big]
+
+
+def fan_out_many(post_ids):
+    """Раздает пачку постов, записанных в обход сигналов (bulk_create)."""
+    posts = defaultdict(list)
+    for post_id, author_id, pub_date in Post.objects.filter(
+            pk__in=post_ids).values_list('id', 'author_id', 'pub_date'):
+        posts[author_id].append((post_id, pub_date))
+    followers = Follow.objects.filter(author_id__in=_small_authors(posts))
+    _bulk_insert(
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for author_id, user_id in followers.values_list(
+            'author_id', 'user_id').iterator(chunk_size=BATCH_SIZE)
+        for post_id, pub_date in posts[author_id]
+    )
+
+
+def backfill_many(follows):
+    """Заполняет ленты пачки подписок, записанных через bulk_create."""
+    followers = defaultdict(list)
+    for follow in follows:
+        followers[follow.author_id].append(follow.user_id)
+    _fill(followers, _small_authors(followers))
+
+
+def _fill(followers, author_ids):
+    """Раздает посты author_ids подписчикам из followers[author_id]."""
+    posts = Post.objects.filter(
+        author_id__in=author_ids
+    ).values_list('id', 'author_id', 'pub_date')
+    _bulk_insert(
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, author_id, pub_date in posts.iterator(
+            chunk_size=BATCH_SIZE)
+        for user_id in followers[author_id]
+    )
+
+
+def followers_dropped(author_id):
+    """Дозаполняет ленты, если автор перестал быть крупным.
+
+    Вызывается после отписки. Пока подписчиков было больше предела,
+    посты и новые подписки автора в ленты не попадали, а теперь они
+    перестанут подмешиваться при чтении. Уже разданные записи
+    bulk_create пропускает (ignore_conflicts).
+    """
+    if UserStats.objects.filter(
+            user_id=author_id, followers_count=fanout_limit()).exists():
+        # Автор уже не крупный, проверять его через _small_authors незачем
+        follower_ids = Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)
+        _fill({author_id: list(follower_ids)}, [author_id])
+
+
+def remove(follow):
+    """Убирает из ленты посты автора, от которого отписались."""
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id, post__author_id=follow.author_id
+    ).delete()
+
+
+def big_authors(user):
+    """Авторы из подписок, чьи посты не раздаются по лентам."""
+    return Follow.objects.filter(
+        user=user, author__stats__followers_count__gt=fanout_limit()
+    ).values_list('author_id', flat=True)
+
+
+def feed(user):
+    """Посты ленты подписок пользователя."""
+    big = list(big_authors(user))
+    if not big:
+        posts = Post.objects.filter(timeline_entries__user=user).annotate(
+            feed_pub_date=F('timeline_entries__pub_date'),
+            feed_post_id=F('timeline_entries__post_id'),
+        )
+    else:
+        posts = Post.objects.filter(
+            Q(id__in=TimelineEntry.objects.filter(user=user).values('post_id'))
+            | Q(author_id__in=big)
+        ).annotate(feed_pub_date=F('pub_date'), feed_post_id=F('id'))
+    return posts.order_by(*FEED_ORDERING)
@@ -1,22 +1,37 @@
 from django.urls import path
 
 from . import views
+from .querycount import query_budget
 
 app_name = 'posts'
 
+# Бюджет - сколько SQL-запросов маршрут может сделать за один вызов,
+# не считая размера страницы; проверяется в tests/test_query_budgets.py
 urlpatterns = [
     # Главная страница
-    path('', views.index, name='index'),
-    path('create/', views.post_create, name='post_create'),
-    path('group/<slug:slug>/', views.group_posts, name='group_list'),
-    path('profile/<str:username>/', views.profile, name='profile'),
-    path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
-    path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('', query_budget(6)(views.index), name='index'),
+    path('create/', query_budget(15)(views.post_create), name='post_create'),
+    path('search/', query_budget(6)(views.search), name='search'),
+    path('group/<slug:slug>/', query_budget(6)(views.group_posts),
+         name='group_list'),
+    path('group/<slug:slug>/export/', query_budget(6)(views.group_export),
+         name='group_export'),
+    path('profile/<str:username>/', query_budget(8)(views.profile),
+         name='profile'),
+    path('profile/<str:username>/export/',
+         query_budget(6)(views.profile_export), name='profile_export'),
+    path('posts/<int:post_id>/edit/', query_budget(12)(views.post_edit),
+         name='post_edit'),
+    path('posts/<int:post_id>/', query_budget(6)(views.post_detail),
+         name='post_detail'),
+    path('posts/<int:post_id>/comments/',
+         query_budget(4)(views.post_comments), name='post_comments'),
     path('posts/<int:post_id>/comment/',
-         views.add_comment, name='add_comment'),
-    path('follow/', views.follow_index, name='follow_index'),
-    path('profile/<str:username>/follow/', views.profile_follow,
-         name='profile_follow'),
-    path('profile/<str:username>/unfollow/', views.profile_unfollow,
-         name='profile_unfollow'),
+         query_budget(10)(views.add_comment), name='add_comment'),
+    path('follow/', query_budget(6)(views.follow_index),
+         name='follow_index'),
+    path('profile/<str:username>/follow/',
+         query_budget(16)(views.profile_follow), name='profile_follow'),
+    path('profile/<str:username>/unfollow/',
+         query_budget(14)(views.profile_unfollow), name='profile_unfollow'),
 ]
@@ -1,82 +1,187 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from . import export
+from . import search as post_search
+from . import bundles, counters, thumbnails, timeline
+from .cache import shared_cache_page
+from .conditional import (conditional_page, generation_validators,
+                          post_validators)
 from .forms import CommentForm, PostForm
 from .models import Follow, Group, Post
+from .pagination import (ApproximatePaginator, CursorPage, CursorPaginator,
+                         WindowedPaginator)
+from .replicas import read_replica
 
 
-def paginator(request, object):
-    paginator = Paginator(object, settings.POSTS_PER_PAGE)
+def paginator(request, object, count=None):
+    """Страница ленты; count - функция, которая дает примерное число."""
+    if settings.POSTS_PAGINATION == 'cursor':
+        return CursorPaginator(
+            object, settings.POSTS_PER_PAGE).get_page(request.GET)
+    if count is None:
+        paginator = WindowedPaginator(object, settings.POSTS_PER_PAGE)
+    else:
+        paginator = ApproximatePaginator(
+            object, settings.POSTS_PER_PAGE, count)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
 
 
-@cache_page(20, key_prefix='index_page')
+@read_replica
+@conditional_page(generation_validators('index'))
+@shared_cache_page('index')
 def index(request):
     template = 'posts/index.html'
-    post_list = Post.objects.all()
+    post_list = Post.objects.for_listing()
     context = {
-        'page_obj': paginator(request, post_list)
+        'page_obj': paginator(request, post_list, lambda: (
+            counters.listing_count('all', Post.objects.all())))
     }
     return render(request, template, context)
 
 
 # В урл мы ждем парметр, и нужно его прередать в функцию для использования
+@read_replica
+@conditional_page(generation_validators('group:{slug}', 'users'))
+@shared_cache_page('group:{slug}', 'users')
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.group_posts.all()
+    posts = group.group_posts.for_listing()
     context = {
-        'page_obj': paginator(request, posts),
+        'page_obj': paginator(request, posts, lambda: (
+            counters.listing_count(
+                counters.group_scope(group.pk), group.group_posts.all()))),
         'group': group,
     }
     return render(request, template, context)
 
 
+@read_replica
+@conditional_page(generation_validators('profile:{username}'))
+@shared_cache_page('profile:{username}')
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    posts = author.posts.for_listing()
+    stats = counters.user_stats(author)
     template = 'posts/profile.html'
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user, author=author).exists()
-    else:
-        following = False
     context = {
-        'page_obj': paginator(request, posts),
-        'posts_count': author.posts.count(),
+        'page_obj': paginator(request, posts, lambda: stats.posts_count),
+        'posts_count': stats.posts_count,
         'author': author,
-        'following': following,
     }
     return render(request, template, context)
 
 
+def comments_page(request, post_id, bundle=None):
+    # Порция комментариев по курсору (-created, -id), без COUNT(*)
+    paginator = CursorPaginator(
+        bundles.comments_for(post_id), settings.COMMENTS_PER_PAGE)
+    if bundle is None or 'after' in request.GET or 'before' in request.GET:
+        return paginator.get_page(request.GET)
+    # Первая порция уже есть в кэше поста
+    page = CursorPage(bundle['comments'], paginator, bundle['has_next'], False)
+    page.params = request.GET
+    return page
+
+
+@read_replica
+@conditional_page(post_validators)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    # Пост уже мог прочитать conditional_page
+    if hasattr(request, 'post_bundle'):
+        bundle = request.post_bundle
+    else:
+        bundle = bundles.load(post_id)
+    if bundle is None:
+        raise Http404('No Post matches the given query.')
     template = 'posts/post_detail.html'
-    comments = post.comments.all()
     form = CommentForm(request.POST or None)
     context = {
-        'post': post,
+        'post': bundle['post'],
         'form': form,
-        'comments': comments,
+        'comments': comments_page(request, post_id, bundle),
+    }
+    return render(request, template, context)
+
+
+@read_replica
+def post_comments(request, post_id):
+    """Следующая порция комментариев для подгрузки на post_detail."""
+    post = get_object_or_404(Post.objects.only('pk'), id=post_id)
+    template = 'includes/comment_list.html'
+    context = {
+        'post': post,
+        'comments': comments_page(request, post_id),
+    }
+    return render(request, template, context)
+
+
+def export_response(request, posts, filename):
+    format = request.GET.get('format')
+    if format not in export.FORMATS:
+        format = 'jsonl'
+    response = StreamingHttpResponse(
+        export.export_lines(posts, format, request.build_absolute_uri),
+        content_type=export.FORMATS[format][1],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{filename}.{format}"')
+    return response
+
+
+@login_required
+def profile_export(request, username):
+    author = get_object_or_404(User, username=username)
+    return export_response(request, author.posts.all(), author.username)
+
+
+@login_required
+def group_export(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return export_response(request, group.group_posts.all(), group.slug)
+
+
+def search(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '')
+    group = author = None
+    if request.GET.get('group'):
+        group = Group.objects.filter(slug=request.GET['group']).first()
+    if request.GET.get('author'):
+        author = User.objects.filter(username=request.GET['author']).first()
+    search_paginator = post_search.SearchPaginator(
+        query,
+        settings.POSTS_PER_PAGE,
+        group_id=group.pk if group else None,
+        author_id=author.pk if author else None,
+    )
+    context = {
+        'page_obj': search_paginator.get_page(request.GET),
+        'query': query,
+        'group': group,
+        'author': author,
     }
     return render(request, template, context)
 
 
 @login_required
+@transaction.atomic
 def post_create(request):
     template = 'posts/create.html'
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.pregenerate(post)
         return redirect('posts:profile', post.author)
     context = {
         'form': form,
@@ -97,6 +202,8 @@ def post_edit(request, post_id):
 
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.pregenerate(post)
         return redirect('posts:post_detail', post_id)
     context = {
         'form': form,
@@ -107,6 +214,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     # Получите пост и сохраните его в переменную post.
     post = get_object_or_404(Post, id=post_id)
@@ -124,12 +232,14 @@ def add_comment(request, post_id):
     return render(request, template, context)
 
 
+@read_replica
 @login_required
+# Лента собирается из подписок: ее меняют посты (поколение index)
+# и подписки самого пользователя
+@conditional_page(generation_validators('index', 'follows:{user}'))
 def follow_index(request):
     template = 'posts/follow.html'
-    posts = Post.objects.filter(
-        author__following__user=request.user
-    ).select_related('author', 'group')
+    posts = timeline.feed(request.user).for_listing()
     context = {
         'page_obj': paginator(request, posts),
     }
@@ -137,6 +247,7 @@ def follow_index(request):
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user.is_authenticated and request.user != author:
@@ -148,6 +259,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     follow = Follow.objects.filter(
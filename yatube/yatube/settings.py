@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы учесть запросы всех остальных middleware
+    'posts.querycount.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'posts.replicas.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -84,13 +87,34 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# core.db.sqlite - sqlite3 с WAL, прагмами и повтором при блокировке;
+# соединение живет между запросами CONN_MAX_AGE секунд
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db.sqlite',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Реплики для чтения ленты подписок и порций комментариев - страниц вне
+# общего кэша; остальное читается из default (posts.replicas).
+# YATUBE_REPLICAS=2 добавляет replica1 и replica2 - локальные копии базы,
+# их обновляет manage.py sync_replicas. В тестах реплики смотрят в
+# тестовую default
+DATABASE_REPLICAS = []
+for number in range(1, int(os.environ.get('YATUBE_REPLICAS', 0)) + 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'core.db.sqlite',
+        'NAME': os.path.join(BASE_DIR, f'db.replica{number}.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['posts.replicas.ReplicaRouter']
+# Сколько секунд после записи клиент читает только из default
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -133,6 +157,65 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
 POSTS_PER_PAGE = 10
+# 'pages' - номера страниц (Paginator), 'cursor' - keyset-пагинация
+# по (pub_date, id) с токенами ?after=/?before=
+POSTS_PAGINATION = 'pages'
+# Комментарии на post_detail отдаются порциями, следующие подгружаются
+# с posts:post_comments
+COMMENTS_PER_PAGE = 20
+# Число постов ленты и групп для пагинатора берется из счетчиков
+# (posts.counters), точный COUNT(*) - только если постов не больше
+# EXACT_COUNT_LIMIT; счетчик в кэше пересчитывается раз в TTL
+EXACT_COUNT_LIMIT = 1000
+LISTING_COUNT_TIMEOUT = 60 * 10
+# Посты авторов с большим числом подписчиков не раздаются по лентам,
+# а подмешиваются в follow_index при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+# Общий для всех воркеров кэш в файле SQLite (core.cache): cache_page,
+# {% cache %}, поколения posts.cache и сессии видят одни и те же данные
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
+    }
+}
+# Тесты работают с кэшем во временном файле и падают на превышении
+# бюджета запросов
+TEST_RUNNER = 'core.runner.TestRunner'
+# Сессии читаются из кэша, а база остается источником истины
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# Страницы лент сбрасываются сигналами (posts.cache), TTL лишь страховка
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+# Общая копия свежая PAGE_CACHE_FRESH_TIMEOUT секунд, после этого или
+# смены поколения ее перестраивает один воркер с арендой на
+# PAGE_CACHE_LEASE_TIMEOUT, а остальные отдают старую. Если копии нет
+# совсем, воркеры ждут ее, пока держится аренда, но не дольше
+# PAGE_CACHE_LEASE_WAIT секунд
+PAGE_CACHE_FRESH_TIMEOUT = 60
+PAGE_CACHE_LEASE_TIMEOUT = 30
+PAGE_CACHE_LEASE_WAIT = 2
+# Как часто процесс добавляет свои счетчики кэшей к общим (posts.stats)
+CACHE_STATS_FLUSH_INTERVAL = 10
+# Одна копия страницы на всех пользователей, персональные куски
+# подставляются на каждом запросе (posts.fragments)
+PAGE_CACHE_SHARED = True
+# Пост с автором, группой и первой порцией комментариев для post_detail
+# (posts.bundles); сбрасывается сигналами, TTL лишь страховка
+POST_BUNDLE_TIMEOUT = 60 * 60
+# Карточка поста в лентах (posts.cards): ключ меняется с постом, TTL лишь
+# убирает из кэша карточки, на которые ключей уже нет
+POST_CARD_TIMEOUT = 24 * 60 * 60
+# Учет запросов на каждый HTTP-запрос (posts.querycount): превышение
+# бюджета маршрута и запросы одной формы, повторенные больше
+# QUERY_REPEAT_LIMIT раз, пишутся в лог
+QUERY_COUNT_ENABLED = DEBUG
+QUERY_REPEAT_LIMIT = 2
+# Превышение бюджета - исключение, а не запись в лог; включают тесты
+QUERY_BUDGET_STRICT = False
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -149,3 +232,21 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Миниатюры создаются в пуле процессов (posts.thumbnails), пока их нет,
+# шаблоны показывают заглушку. 0 воркеров - генерация в том же процессе
+THUMBNAIL_BACKEND = 'posts.thumbnails.QueuedThumbnailBackend'
+# KVStore миниатюр с LRU в памяти процесса поверх cached_db (posts.kvstore)
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+THUMBNAIL_LRU_SIZE = 10000
+# Сколько секунд запись живет в LRU процесса: удаление в другом процессе
+# его LRU не сбрасывает
+THUMBNAIL_LRU_TTL = 60
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_PLACEHOLDER = 'img/placeholder.svg'
+# Сколько раз пробовать создать миниатюру, прежде чем счесть картинку
+# битой, и сколько секунд помнить об этом
+THUMBNAIL_MAX_ATTEMPTS = 3
+THUMBNAIL_FAILURE_TIMEOUT = 24 * 60 * 60
+POST_THUMBNAIL_GEOMETRY = '960x339'
+POST_THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}